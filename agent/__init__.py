@@ -1,6 +1,21 @@
 """LangChain agent package."""
-# We export these but they might cause imports if not careful
-# For safety, let's keep it minimal
-from .memory import FinancialMemory
+# Exports are resolved lazily (PEP 562) so importing the package does not
+# pull in tool modules, numpy or LangChain until an agent is actually used.
+_EXPORTS = {
+    "FinancialMemory": "agent.memory",
+    "GeminiWealthAdvisorAgent": "agent.gemini_agent",
+    "DemoWealthAdvisorAgent": "agent.gemini_agent",
+    "WealthAdvisorAgent": "agent.chains",
+    "create_wealth_agent": "agent.chains",
+}
 
-__all__ = ["FinancialMemory"]
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        import importlib
+        value = getattr(importlib.import_module(_EXPORTS[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
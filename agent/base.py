@@ -0,0 +1,200 @@
+"""Shared base for the wealth advisor agents."""
+import re
+import functools
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Any, AsyncIterator, Callable, Iterator, List, Optional, Tuple
+
+from .memory import FinancialMemory
+from .runtime import iter_sync, run_sync, run_user_batches
+
+# Max distinct inputs memoized per tool
+_TOOL_CACHE_SIZE = 512
+
+
+@functools.cache
+def _load_tools() -> Dict[str, Callable[[str], str]]:
+    """
+    Import tool functions on first use (the analytics pull in numpy).
+
+    The mapping is built once per process and shared by every agent. Tool
+    output depends only on the JSON input string, so each tool is memoized;
+    repeated inputs (demo payloads, resubmitted portfolios) skip the analytics.
+    """
+    from tools.risk_assessment import calculate_portfolio_risk_tool, assess_risk_tolerance_tool
+    from tools.diversification import analyze_diversification_tool, suggest_rebalancing_tool
+    from tools.strategy import design_strategy_tool
+
+    tools = {
+        "calculate_portfolio_risk": calculate_portfolio_risk_tool,
+        "assess_risk_tolerance": assess_risk_tolerance_tool,
+        "analyze_diversification": analyze_diversification_tool,
+        "suggest_rebalancing": suggest_rebalancing_tool,
+        "design_investment_strategy": design_strategy_tool,
+    }
+    return {
+        name: functools.lru_cache(maxsize=_TOOL_CACHE_SIZE)(func)
+        for name, func in tools.items()
+    }
+
+
+# Tiny inputs that exercise each tool's code path once during warmup
+_WARMUP_INPUTS = {
+    "calculate_portfolio_risk": '[{"symbol": "_WARM", "value": 1, "asset_class": "equity"}]',
+    "assess_risk_tolerance": '{"age": 35, "time_horizon": 20}',
+    "analyze_diversification": '[{"symbol": "_WARM", "value": 1, "asset_class": "equity"}]',
+    "suggest_rebalancing": '[{"symbol": "_WARM", "value": 1, "asset_class": "equity"}]',
+    "design_investment_strategy": '{"risk_profile": "moderate"}',
+}
+
+# Set once the tool modules are imported and each tool has run once
+_TOOLS_WARMED = threading.Event()
+_warmup_started = False
+_warmup_lock = threading.Lock()
+
+
+def _warmup_tools():
+    """Import the tool modules and run each tool once on a throwaway input."""
+    try:
+        for name, func in _load_tools().items():
+            # Call the undecorated function so warmup inputs stay out of the cache
+            func.__wrapped__(_WARMUP_INPUTS[name])
+    finally:
+        _TOOLS_WARMED.set()
+
+
+def start_tool_warmup():
+    """
+    Warm the tools on a daemon thread, once per process.
+
+    Hides the cold import cost (numpy and the analytics modules) behind the
+    user's think time instead of charging it to the first message.
+    """
+    global _warmup_started
+    with _warmup_lock:
+        if _warmup_started:
+            return
+        _warmup_started = True
+    threading.Thread(target=_warmup_tools, name="tool-warmup", daemon=True).start()
+
+
+# Demo-mode intent detection: one regex pass collects keyword hits, then the
+# first rule they satisfy picks the tool, so rule order is the priority.
+_DEMO_KEYWORD_RE = re.compile(
+    r"risk|assess|tolerance|diversif|strateg|rebalanc|portfolio", re.IGNORECASE
+)
+_DEMO_INTENT_RULES = (
+    # (tool name, all of, any of)
+    ("assess_risk_tolerance", frozenset({"risk"}), frozenset({"assess", "tolerance"})),
+    ("analyze_diversification", frozenset({"diversif"}), frozenset()),
+    ("design_investment_strategy", frozenset({"strateg"}), frozenset()),
+    ("suggest_rebalancing", frozenset({"rebalanc"}), frozenset()),
+    ("calculate_portfolio_risk", frozenset({"portfolio", "risk"}), frozenset()),
+)
+
+
+def _match_demo_intent(user_input: str) -> Optional[str]:
+    """Map a demo query to a tool name, or None for the greeting."""
+    found = {keyword.lower() for keyword in _DEMO_KEYWORD_RE.findall(user_input)}
+    for tool_name, required, any_of in _DEMO_INTENT_RULES:
+        if required <= found and (not any_of or any_of & found):
+            return tool_name
+    return None
+
+
+class BaseWealthAgent(ABC):
+    """
+    Behaviour shared by every wealth advisor agent.
+
+    Subclasses implement achat(); memory access, the blocking chat()
+    wrapper, batching and the keyword-driven demo responses live here.
+    """
+
+    # Serialized sample input per tool name, and the reply for unmatched queries
+    demo_inputs: Dict[str, str] = {}
+    demo_greeting: str = ""
+
+    def __init__(self, user_id: str = "default"):
+        self.user_id = user_id
+        self.memory = FinancialMemory(user_id=user_id)
+        start_tool_warmup()
+
+    def chat(self, user_input: str) -> str:
+        """
+        Process user input and return agent response.
+
+        Blocking wrapper around achat() that runs on the shared event loop.
+
+        Args:
+            user_input: User's message/query
+
+        Returns:
+            Agent's response string
+        """
+        return run_sync(self.achat(user_input))
+
+    @abstractmethod
+    async def achat(self, user_input: str) -> str:
+        """Process user input without blocking the event loop."""
+
+    def stream_chat(self, user_input: str) -> Iterator[str]:
+        """Blocking wrapper around astream_chat() that runs on the shared event loop."""
+        return iter_sync(self.astream_chat(user_input))
+
+    async def astream_chat(self, user_input: str) -> AsyncIterator[str]:
+        """
+        Process user input, yielding the response as it is generated.
+
+        Agents without a streaming LLM path yield the whole response at once.
+        """
+        yield await self.achat(user_input)
+
+    @classmethod
+    async def arun_batch(
+        cls, inputs: List[Tuple[str, str]], agents: Optional[Dict[str, Any]] = None
+    ) -> List[str]:
+        """
+        Answer many (user_id, message) pairs concurrently.
+
+        Args:
+            inputs: (user_id, message) pairs
+            agents: Optional existing agents by user_id; missing ones are created
+
+        Returns:
+            Replies in the same order as inputs
+        """
+        return await run_user_batches(inputs, lambda user_id: cls(user_id=user_id), agents)
+
+    @classmethod
+    def run_batch(
+        cls, inputs: List[Tuple[str, str]], agents: Optional[Dict[str, Any]] = None
+    ) -> List[str]:
+        """Blocking wrapper around arun_batch()."""
+        return run_sync(cls.arun_batch(inputs, agents))
+
+    def _demo_response(self, user_input: str) -> str:
+        """Answer with a tool run on sample data, picked by keyword (no LLM)."""
+        tool_name = _match_demo_intent(user_input)
+        if tool_name is None or tool_name not in self.demo_inputs:
+            return self.demo_greeting
+        return _load_tools()[tool_name](self.demo_inputs[tool_name])
+
+    def update_preferences(self, preferences: Dict[str, Any]):
+        """Update user's financial preferences."""
+        self.memory.save_preferences(preferences)
+
+    def update_portfolio(self, portfolio: Dict[str, Any]):
+        """Update user's portfolio data."""
+        self.memory.save_portfolio(portfolio)
+
+    def get_memory_summary(self) -> str:
+        """Get summary of stored user data."""
+        return self.memory.get_memory_summary()
+
+    def clear_conversation(self):
+        """Clear conversation history."""
+        self.memory.clear_history()
+
+    def close(self):
+        """Flush buffered memory writes; call when the agent is discarded."""
+        self.memory.close()
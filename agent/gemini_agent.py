@@ -1,26 +1,114 @@
 """Gemini and Demo agents - No LangChain dependencies."""
 import os
-import sys
-from typing import Dict, Any
+import asyncio
+from typing import Dict, Any, AsyncIterator, Callable
 
-# Add parent directory to path for imports
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.fast_json import dumps
 
-from agent.prompts import SYSTEM_PROMPT
-from agent.memory import FinancialMemory
-from tools.risk_assessment import calculate_portfolio_risk_tool, assess_risk_tolerance_tool
-from tools.diversification import analyze_diversification_tool, suggest_rebalancing_tool
-from tools.strategy import design_strategy_tool
+from .prompts import GEMINI_SYSTEM_PROMPT
+from .base import BaseWealthAgent, _load_tools
+from .runtime import llm_semaphore
 
 
-class GeminiWealthAdvisorAgent:
+def _serialize_demo_inputs(inputs: Dict[str, Any]) -> Dict[str, str]:
+    """Serialize sample tool inputs once at import; they never change."""
+    return {tool_name: dumps(payload) for tool_name, payload in inputs.items()}
+
+
+# Sample tool inputs used when Gemini/OpenRouter is not configured
+_FALLBACK_DEMO_INPUTS = _serialize_demo_inputs({
+    "assess_risk_tolerance": {
+        "age": 35, "time_horizon": 20, 
+        "loss_reaction": "hold", "goal": "growth"
+    },
+    "analyze_diversification": [
+        {"symbol": "VTI", "value": 50000, "asset_class": "equity", "sector": "diversified", "geography": "US"},
+        {"symbol": "BND", "value": 20000, "asset_class": "bond", "sector": "bonds", "geography": "US"},
+    ],
+    "design_investment_strategy": {
+        "risk_profile": "moderate",
+        "goals": [{"goal_type": "retirement", "target_amount": 1000000, "years": 25}],
+    },
+    "suggest_rebalancing": [
+        {"symbol": "VTI", "value": 60000, "asset_class": "equity"},
+        {"symbol": "BND", "value": 20000, "asset_class": "bond"},
+    ],
+    "calculate_portfolio_risk": [
+        {"symbol": "VTI", "value": 50000, "asset_class": "equity"},
+        {"symbol": "BND", "value": 20000, "asset_class": "bond"},
+    ],
+})
+
+_FALLBACK_GREETING = """👋 Hello! I'm your Wealth Management AI Assistant.
+
+⚠️ **Gemini API not configured.** To enable full AI chat:
+1. Get free API key at: https://aistudio.google.com/apikey
+2. Add to .env: GOOGLE_API_KEY=your_key_here
+
+I can still help with these commands:
+• "Assess my risk tolerance"
+• "Analyze my portfolio diversification"
+• "Design an investment strategy"
+• "Suggest rebalancing for my portfolio"
+• "What's the risk level of my portfolio?"
+"""
+
+# Sample tool inputs for the no-API-key demo agent
+_DEMO_INPUTS = _serialize_demo_inputs({
+    "assess_risk_tolerance": {
+        "age": 35, "time_horizon": 20, 
+        "loss_reaction": "hold", "goal": "growth"
+    },
+    "analyze_diversification": [
+        {"symbol": "VTI", "value": 50000, "asset_class": "equity", "sector": "diversified", "geography": "US"},
+        {"symbol": "BND", "value": 20000, "asset_class": "bond", "sector": "bonds", "geography": "US"},
+        {"symbol": "AAPL", "value": 15000, "asset_class": "equity", "sector": "technology", "geography": "US"},
+    ],
+    "design_investment_strategy": {
+        "risk_profile": "moderate",
+        "goals": [{"goal_type": "retirement", "target_amount": 1000000, "years": 25}],
+        "current_portfolio_value": 50000,
+        "monthly_contribution": 1000
+    },
+    "suggest_rebalancing": [
+        {"symbol": "VTI", "value": 60000, "asset_class": "equity"},
+        {"symbol": "BND", "value": 20000, "asset_class": "bond"},
+    ],
+    "calculate_portfolio_risk": [
+        {"symbol": "VTI", "value": 50000, "asset_class": "equity"},
+        {"symbol": "BND", "value": 20000, "asset_class": "bond"},
+    ],
+})
+
+_DEMO_GREETING = """👋 Hello! I'm your Wealth Management AI Assistant.
+
+I can help you with:
+• **Portfolio Risk Assessment** - Analyze your portfolio's risk metrics
+• **Risk Tolerance Assessment** - Determine your investor profile
+• **Diversification Analysis** - Check if your portfolio is well-diversified
+• **Investment Strategy** - Get personalized investment recommendations
+• **Rebalancing** - Get suggestions to rebalance your portfolio
+
+Try asking me:
+- "Assess my risk tolerance"
+- "Analyze my portfolio diversification"
+- "Design an investment strategy for retirement"
+- "Suggest rebalancing for my portfolio"
+- "What's the risk level of my portfolio?"
+"""
+
+
+class GeminiWealthAdvisorAgent(BaseWealthAgent):
     """
     Wealth advisor agent using Google Gemini or OpenRouter.
     """
     
+    # Used when no LLM client is configured
+    demo_inputs = _FALLBACK_DEMO_INPUTS
+    demo_greeting = _FALLBACK_GREETING
+    
     def __init__(self, user_id: str = "default"):
-        self.user_id = user_id
-        self.memory = FinancialMemory(user_id=user_id)
+        super().__init__(user_id)
         
         # Import settings
         from config.settings import settings
@@ -30,14 +118,14 @@ class GeminiWealthAdvisorAgent:
         # Initialize client based on settings
         if settings.primary_model == "openrouter":
             try:
-                from ai.openrouter_client import OpenRouterClient
-                self.client = OpenRouterClient()
+                from ai.openrouter_client import get_openrouter_client
+                self.client = get_openrouter_client()
             except ImportError:
                 print("Failed to import OpenRouterClient")
         elif settings.primary_model == "gemini":
             try:
-                from ai.gemini_client import GeminiClient
-                self.client = GeminiClient()
+                from ai.gemini_client import get_gemini_client
+                self.client = get_gemini_client()
             except ImportError:
                 print("Failed to import GeminiClient")
             
@@ -46,193 +134,79 @@ class GeminiWealthAdvisorAgent:
              # Try Gemini as fallback default if configured
              if os.getenv("GOOGLE_API_KEY"):
                  try:
-                    from ai.gemini_client import GeminiClient
-                    self.client = GeminiClient()
+                    from ai.gemini_client import get_gemini_client
+                    self.client = get_gemini_client()
                  except: pass
         
-        # Tool mapping
-        self.tools = {
-            "calculate_portfolio_risk": calculate_portfolio_risk_tool,
-            "assess_risk_tolerance": assess_risk_tolerance_tool,
-            "analyze_diversification": analyze_diversification_tool,
-            "suggest_rebalancing": suggest_rebalancing_tool,
-            "design_investment_strategy": design_strategy_tool,
-        }
+    @property
+    def tools(self) -> Dict[str, Callable[[str], str]]:
+        """Tool name -> function mapping, loaded on first use."""
+        return _load_tools()
     
-    def chat(self, user_input: str) -> str:
-        """Process user input using Gemini AI."""
-        import json
-        
-        self.memory.add_message("user", user_input)
-        
+    async def achat(self, user_input: str) -> str:
+        """Process user input using Gemini AI without blocking the event loop."""
         # If Gemini not available, fall back to demo mode
         if not self.client or not self.client.is_available:
-            return self._demo_response(user_input)
+            response = self._demo_response(user_input)
+            await asyncio.to_thread(self.memory.add_turn, user_input, response)
+            return response
         
-        # Build system prompt
-        system_prompt = """You are WealthAdvisor, an expert AI financial assistant.
-
-You have these tools available:
-1. calculate_portfolio_risk - Analyze portfolio VaR, Sharpe ratio, volatility
-2. assess_risk_tolerance - Evaluate user's investor profile
-3. analyze_diversification - Check portfolio diversification
-4. suggest_rebalancing - Recommend trades to rebalance
-5. design_investment_strategy - Create personalized investment plans
-
-When you need to use a tool, respond with:
-TOOL: <tool_name>
-INPUT: <json_input>
-
-Be helpful, professional, and provide actionable advice."""
-
         # Get preferences context
-        preferences = self.memory.get_preferences()
-        if preferences:
-            pref_str = ", ".join([f"{k}: {v}" for k, v in preferences.items()])
-            user_input = f"[User profile: {pref_str}]\n\n{user_input}"
+        prompt = self.memory.get_profile_prefix() + user_input
         
         try:
-            response = self.client.generate_with_tools(
-                user_input, 
-                self.tools, 
-                system_prompt
-            )
+            async with llm_semaphore():
+                response = await self.client.agenerate_with_tools(
+                    prompt, 
+                    self.tools, 
+                    GEMINI_SYSTEM_PROMPT
+                )
         except Exception as e:
             response = f"Error: {str(e)}"
         
-        self.memory.add_message("assistant", response)
+        # Store the whole turn in one write (may hit ChromaDB on disk)
+        await asyncio.to_thread(self.memory.add_turn, user_input, response)
         return response
     
-    def _demo_response(self, user_input: str) -> str:
-        """Fallback demo response when Gemini is not configured."""
-        import json
-        user_lower = user_input.lower()
+    async def astream_chat(self, user_input: str) -> AsyncIterator[str]:
+        """
+        Process user input, yielding the response as it is generated.
         
-        if "risk" in user_lower and ("assess" in user_lower or "tolerance" in user_lower):
-            return assess_risk_tolerance_tool(json.dumps({
-                "age": 35, "time_horizon": 20, 
-                "loss_reaction": "hold", "goal": "growth"
-            }))
-        elif "diversif" in user_lower:
-            return analyze_diversification_tool(json.dumps([
-                {"symbol": "VTI", "value": 50000, "asset_class": "equity", "sector": "diversified", "geography": "US"},
-                {"symbol": "BND", "value": 20000, "asset_class": "bond", "sector": "bonds", "geography": "US"},
-            ]))
-        elif "strateg" in user_lower:
-            return design_strategy_tool(json.dumps({
-                "risk_profile": "moderate",
-                "goals": [{"goal_type": "retirement", "target_amount": 1000000, "years": 25}],
-            }))
-        elif "rebalanc" in user_lower:
-            return suggest_rebalancing_tool(json.dumps([
-                {"symbol": "VTI", "value": 60000, "asset_class": "equity"},
-                {"symbol": "BND", "value": 20000, "asset_class": "bond"},
-            ]))
-        elif "portfolio" in user_lower and "risk" in user_lower:
-            return calculate_portfolio_risk_tool(json.dumps([
-                {"symbol": "VTI", "value": 50000, "asset_class": "equity"},
-                {"symbol": "BND", "value": 20000, "asset_class": "bond"},
-            ]))
-        else:
-            return """👋 Hello! I'm your Wealth Management AI Assistant.
-
-⚠️ **Gemini API not configured.** To enable full AI chat:
-1. Get free API key at: https://aistudio.google.com/apikey
-2. Add to .env: GOOGLE_API_KEY=your_key_here
-
-I can still help with these commands:
-• "Assess my risk tolerance"
-• "Analyze my portfolio diversification"
-• "Design an investment strategy"
-• "Suggest rebalancing for my portfolio"
-• "What's the risk level of my portfolio?"
-"""
-    
-    def update_preferences(self, preferences: Dict[str, Any]):
-        self.memory.save_preferences(preferences)
-    
-    def update_portfolio(self, portfolio: Dict[str, Any]):
-        self.memory.save_portfolio(portfolio)
-    
-    def get_memory_summary(self) -> str:
-        return self.memory.get_memory_summary()
-    
-    def clear_conversation(self):
-        self.memory.clear_history()
+        The whole turn is added to memory once the stream ends.
+        """
+        if not self.client or not self.client.is_available:
+            response = self._demo_response(user_input)
+            await asyncio.to_thread(self.memory.add_turn, user_input, response)
+            yield response
+            return
+        
+        prompt = self.memory.get_profile_prefix() + user_input
+        
+        chunks = []
+        try:
+            async with llm_semaphore():
+                async for chunk in self.client.astream_with_tools(
+                    prompt, self.tools, GEMINI_SYSTEM_PROMPT
+                ):
+                    chunks.append(chunk)
+                    yield chunk
+        finally:
+            # Runs even if the consumer stops early (e.g. client disconnect)
+            await asyncio.to_thread(self.memory.add_turn, user_input, "".join(chunks))
 
 
-class DemoWealthAdvisorAgent:
+class DemoWealthAdvisorAgent(BaseWealthAgent):
     """Demo agent that works without any API key."""
     
-    def __init__(self, user_id: str = "default"):
-        self.user_id = user_id
-        self.memory = FinancialMemory(user_id=user_id)
+    demo_inputs = _DEMO_INPUTS
+    demo_greeting = _DEMO_GREETING
     
     def chat(self, user_input: str) -> str:
         """Process input using tools directly (no LLM)."""
-        import json
-        user_lower = user_input.lower()
-        
-        self.memory.add_message("user", user_input)
-        
-        # Simple keyword matching for demo
-        if "risk" in user_lower and ("assess" in user_lower or "tolerance" in user_lower):
-            response = assess_risk_tolerance_tool(json.dumps({
-                "age": 35, "time_horizon": 20, 
-                "loss_reaction": "hold", "goal": "growth"
-            }))
-        elif "diversif" in user_lower:
-            response = analyze_diversification_tool(json.dumps([
-                {"symbol": "VTI", "value": 50000, "asset_class": "equity", "sector": "diversified", "geography": "US"},
-                {"symbol": "BND", "value": 20000, "asset_class": "bond", "sector": "bonds", "geography": "US"},
-                {"symbol": "AAPL", "value": 15000, "asset_class": "equity", "sector": "technology", "geography": "US"},
-            ]))
-        elif "strateg" in user_lower:
-            response = design_strategy_tool(json.dumps({
-                "risk_profile": "moderate",
-                "goals": [{"goal_type": "retirement", "target_amount": 1000000, "years": 25}],
-                "current_portfolio_value": 50000,
-                "monthly_contribution": 1000
-            }))
-        elif "rebalanc" in user_lower:
-            response = suggest_rebalancing_tool(json.dumps([
-                {"symbol": "VTI", "value": 60000, "asset_class": "equity"},
-                {"symbol": "BND", "value": 20000, "asset_class": "bond"},
-            ]))
-        elif "portfolio" in user_lower and "risk" in user_lower:
-            response = calculate_portfolio_risk_tool(json.dumps([
-                {"symbol": "VTI", "value": 50000, "asset_class": "equity"},
-                {"symbol": "BND", "value": 20000, "asset_class": "bond"},
-            ]))
-        else:
-            response = """👋 Hello! I'm your Wealth Management AI Assistant.
-
-I can help you with:
-• **Portfolio Risk Assessment** - Analyze your portfolio's risk metrics
-• **Risk Tolerance Assessment** - Determine your investor profile
-• **Diversification Analysis** - Check if your portfolio is well-diversified
-• **Investment Strategy** - Get personalized investment recommendations
-• **Rebalancing** - Get suggestions to rebalance your portfolio
-
-Try asking me:
-- "Assess my risk tolerance"
-- "Analyze my portfolio diversification"
-- "Design an investment strategy for retirement"
-- "Suggest rebalancing for my portfolio"
-- "What's the risk level of my portfolio?"
-"""
-        
-        self.memory.add_message("assistant", response)
+        response = self._demo_response(user_input)
+        self.memory.add_turn(user_input, response)
         return response
     
-    def update_preferences(self, preferences: Dict[str, Any]):
-        self.memory.save_preferences(preferences)
-    
-    def update_portfolio(self, portfolio: Dict[str, Any]):
-        self.memory.save_portfolio(portfolio)
-    
-    def get_memory_summary(self) -> str:
-        return self.memory.get_memory_summary()
-    
-    def clear_conversation(self):
-        self.memory.clear_history()
+    async def achat(self, user_input: str) -> str:
+        """Async entry point matching the LLM-backed agents."""
+        return await asyncio.to_thread(self.chat, user_input)
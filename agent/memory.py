@@ -1,8 +1,118 @@
 """ChromaDB conversation memory for personalized recommendations."""
 import os
-from typing import List, Dict, Any, Optional
+import re
+import queue
+import logging
+import hashlib
+import atexit
+import threading
+import weakref
+import zlib
+import functools
+from collections import deque
+from itertools import islice
+from typing import Callable, Deque, List, Dict, Any, Optional
 from dataclasses import dataclass, field
-import json
+
+from utils.chroma import collection_name, get_chroma_client, get_embedding_function
+from utils.fast_json import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# Messages mirrored in process; the full history stays in ChromaDB
+HISTORY_MAXLEN = 512
+
+# Buffered messages per FinancialMemory before they are written to ChromaDB
+WRITE_BATCH_SIZE = 64
+
+# Background writer threads; each user's writes always go to the same one
+WRITER_SHARDS = 4
+
+# Duplicate messages are stored once: exact repeats by their content-hash
+# ID (remembering the most recent SEEN_HASHES_MAX), near repeats by embedding
+SEEN_HASHES_MAX = 10_000
+NEAR_DUPLICATE_DISTANCE = 0.05
+
+# Two-stage context retrieval: over-fetch by query similarity (cosine
+# distance), then re-rank survivors against the recent dialogue.
+COARSE_OVERFETCH = 4
+COARSE_MAX_DISTANCE = 0.5
+RERANK_RECENT_MESSAGES = 5
+RERANK_MIN_SIMILARITY = 0.7
+
+# User IDs safe to use verbatim in a file name; any other ID is hashed
+_SAFE_USER_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+def _silent(func):
+    """Make a ChromaDB helper return None instead of raising; memory is best-effort."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            return None
+    return wrapper
+
+
+class _ChromaWriter:
+    """
+    Applies ChromaDB writes on one daemon thread, in submission order.
+    
+    Chat turns hand their writes over instead of blocking on ChromaDB's
+    persistence. Users are spread over WRITER_SHARDS writers by a stable
+    hash of their ID, so one user's adds, upserts and deletes stay in the
+    order they were made while a slow write only delays its own shard.
+    """
+    
+    def __init__(self, name: str = "chroma-writer"):
+        self._name = name
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+    
+    def submit(self, write: Callable[[], None]) -> threading.Event:
+        """Queue a write; the returned event is set once it has been applied."""
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name=self._name, daemon=True
+                    )
+                    self._thread.start()
+        done = threading.Event()
+        self._queue.put((write, done))
+        return done
+    
+    def _run(self):
+        while True:
+            write, done = self._queue.get()
+            _silent(write)()
+            done.set()
+            self._queue.task_done()
+    
+    def join(self):
+        """Block until every queued write has been applied."""
+        self._queue.join()
+
+
+_writers = [_ChromaWriter(f"chroma-writer-{i}") for i in range(WRITER_SHARDS)]
+
+
+def _writer_for(user_id: str) -> _ChromaWriter:
+    """The writer shard for a user; crc32 rather than hash() so it is stable across runs."""
+    return _writers[zlib.crc32(user_id.encode("utf-8")) % len(_writers)]
+
+# Memories with possibly unflushed writes, flushed at interpreter exit
+_live_memories: "weakref.WeakSet[FinancialMemory]" = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_all():
+    for memory in list(_live_memories):
+        memory.flush()
+    for writer in _writers:
+        writer.join()
 
 
 @dataclass
@@ -29,61 +139,136 @@ class FinancialMemory:
         """
         self.user_id = user_id
         self.persist_directory = persist_directory
-        self.conversation_history: List[ConversationMessage] = []
+        self.conversation_history: Deque[ConversationMessage] = deque(maxlen=HISTORY_MAXLEN)
+        self._message_count = 0  # Messages added since the last clear
         self.user_preferences: Dict[str, Any] = {}
+        self._profile_prefix: Optional[str] = None  # Rendered on demand
         self.portfolio_data: Optional[Dict[str, Any]] = None
+        self._portfolio_total: Optional[float] = None  # Summed on demand
+        
+        # Conversation writes waiting for one batched ChromaDB add
+        self._batch_size = WRITE_BATCH_SIZE
+        self._pending_docs: List[str] = []
+        self._pending_meta: List[Dict[str, Any]] = []
+        self._pending_ids: List[str] = []
+        self._pending_lock = threading.Lock()
+        # (text, vector) of the last searched query; the user's message is
+        # usually stored right after it is searched for
+        self._last_query_embedding: tuple = (None, None)
+        # IDs of stored messages, oldest first (a dict as an ordered set)
+        self._seen_ids: Dict[str, None] = {}
+        # Set once this memory's latest queued write has been applied; the
+        # user's writer shard is FIFO, so every earlier write of this memory
+        # (and of other users on the same shard) is done too
+        self._writer = _writer_for(user_id)
+        self._last_write: Optional[threading.Event] = None
+        
+        # Preferences live in a small local file, independent of ChromaDB
+        self._preferences_path = os.path.join(
+            persist_directory, f"prefs_{self._file_key(user_id)}.json"
+        )
+        self._load_preferences()
         
         # Initialize ChromaDB
         self._init_chromadb()
+        if self.conversations:
+            _live_memories.add(self)
+        if self.client and not self.user_preferences:
+            self._migrate_chroma_preferences()
+    
+    @staticmethod
+    def _file_key(user_id: str) -> str:
+        """File-name-safe form of a user ID; IDs come from request bodies."""
+        if _SAFE_USER_ID.fullmatch(user_id):
+            return user_id
+        return hashlib.blake2b(user_id.encode("utf-8"), digest_size=16).hexdigest()
     
     def _init_chromadb(self):
         """Initialize ChromaDB client and collections."""
         try:
-            import chromadb
-            from chromadb.config import Settings
-            
-            os.makedirs(self.persist_directory, exist_ok=True)
-            
-            self.client = chromadb.Client(Settings(
-                persist_directory=self.persist_directory,
-                anonymized_telemetry=False
-            ))
+            self.client = get_chroma_client(self.persist_directory)
             
             # Collection for conversation history
+            legacy_name = f"conversations_{self.user_id}"
+            name = collection_name("conversations", self.user_id)
             self.conversations = self.client.get_or_create_collection(
-                name=f"conversations_{self.user_id}",
-                metadata={"description": "Conversation history for financial advice"}
+                name=name,
+                metadata={
+                    "description": "Conversation history for financial advice",
+                    "hnsw:space": "cosine",
+                },
+                embedding_function=get_embedding_function()
             )
             
-            # Collection for user preferences
-            self.preferences = self.client.get_or_create_collection(
-                name=f"preferences_{self.user_id}",
-                metadata={"description": "User financial preferences and profile"}
-            )
+            # Embed texts ourselves so one vector serves both search and insert
+            self._embed_fn = getattr(self.conversations, "_embedding_function", None)
             
-            # Load existing preferences
-            self._load_preferences()
+            if name != legacy_name and not self.conversations.count():
+                # Re-embed history stored under an earlier embedding model
+                self._submit(lambda: self._copy_legacy_history(legacy_name))
             
         except ImportError:
             print("ChromaDB not installed. Using in-memory storage only.")
             self.client = None
             self.conversations = None
-            self.preferences = None
+            self._embed_fn = None
+        except Exception as e:
+            # e.g. an embedding function conflict; history will not persist
+            logger.warning(
+                "ChromaDB unavailable for user %r (%s); using in-memory storage only",
+                self.user_id, e
+            )
+            self.client = None
+            self.conversations = None
+            self._embed_fn = None
     
-    def _load_preferences(self):
-        """Load user preferences from ChromaDB."""
-        if not self.preferences:
-            return
-        
-        try:
-            results = self.preferences.get(
-                where={"user_id": self.user_id},
-                limit=1
+    def _copy_legacy_history(self, legacy_name: str):
+        """Move documents from a collection embedded by another model into ours."""
+        legacy = self.client.get_collection(name=legacy_name)
+        stored = legacy.get(include=["documents", "metadatas"])
+        if stored and stored["ids"]:
+            self.conversations.upsert(
+                documents=stored["documents"],
+                metadatas=stored["metadatas"],
+                ids=stored["ids"],
             )
-            if results and results["documents"]:
-                self.user_preferences = json.loads(results["documents"][0])
-        except Exception:
-            pass
+        # Dropped so a later clear_history() cannot be undone by copying again
+        self.client.delete_collection(name=legacy_name)
+    
+    def _load_preferences(self):
+        """Load user preferences saved by an earlier session."""
+        preferences = self._read_preferences()
+        if preferences is not None:
+            self.user_preferences = preferences
+            self._profile_prefix = None
+    
+    @_silent
+    def _read_preferences(self) -> Optional[Dict[str, Any]]:
+        with open(self._preferences_path, "rb") as f:
+            return loads(f.read())
+    
+    @_silent
+    def _migrate_chroma_preferences(self):
+        """Move preferences from the old preferences_{user_id} collection to the file."""
+        name = f"preferences_{self.user_id}"
+        results = self.client.get_collection(name=name).get(
+            where={"user_id": self.user_id},
+            limit=1
+        )
+        if results and results["documents"]:
+            document = results["documents"][0]
+            self._write_preferences(document)
+            self.user_preferences = loads(document)
+            self._profile_prefix = None
+        self.client.delete_collection(name=name)
+    
+    def _write_preferences(self, document: str):
+        """Replace the preferences file atomically so readers never see a partial write."""
+        os.makedirs(self.persist_directory, exist_ok=True)
+        tmp_path = f"{self._preferences_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(document)
+        os.replace(tmp_path, self._preferences_path)
     
     def add_message(self, role: str, content: str, metadata: Dict[str, Any] = None):
         """
@@ -94,37 +279,143 @@ class FinancialMemory:
             content: Message content
             metadata: Optional metadata (e.g., tools used, portfolio analyzed)
         """
-        message = ConversationMessage(
+        self._append([ConversationMessage(
             role=role,
             content=content,
             metadata=metadata or {}
-        )
-        self.conversation_history.append(message)
+        )])
+    
+    def add_turn(self, user_content: str, assistant_content: str, metadata: Dict[str, Any] = None):
+        """
+        Add a user message and the assistant's reply with a single ChromaDB write.
+        
+        Args:
+            user_content: User's message
+            assistant_content: Assistant's response
+            metadata: Optional metadata applied to both messages
+        """
+        self._append([
+            ConversationMessage(role="user", content=user_content, metadata=metadata or {}),
+            ConversationMessage(role="assistant", content=assistant_content, metadata=metadata or {}),
+        ])
+    
+    def _message_id(self, message: ConversationMessage) -> str:
+        """Content-addressed ChromaDB ID, so storing a message again is a no-op."""
+        digest = hashlib.blake2b(
+            f"{message.role}{message.content}".encode("utf-8"), digest_size=12
+        ).hexdigest()
+        return f"{self.user_id}_{digest}"
+    
+    def _append(self, messages: List[ConversationMessage]):
+        """Append messages to history and queue them for a batched ChromaDB write."""
+        self._message_count += len(messages)
+        self.conversation_history.extend(messages)
         
         # Store in ChromaDB for long-term retrieval
-        if self.conversations:
-            try:
-                self.conversations.add(
-                    documents=[content],
-                    metadatas=[{
-                        "role": role,
-                        "user_id": self.user_id,
-                        **(metadata or {})
-                    }],
-                    ids=[f"{self.user_id}_{len(self.conversation_history)}"]
-                )
-            except Exception:
-                pass
+        if not self.conversations:
+            return
+        with self._pending_lock:
+            for m in messages:
+                message_id = self._message_id(m)
+                if message_id in self._seen_ids:
+                    continue
+                self._seen_ids[message_id] = None
+                if len(self._seen_ids) > SEEN_HASHES_MAX:
+                    del self._seen_ids[next(iter(self._seen_ids))]
+                
+                self._pending_docs.append(m.content)
+                self._pending_meta.append({
+                    "role": m.role,
+                    "user_id": self.user_id,
+                    **m.metadata
+                })
+                self._pending_ids.append(message_id)
+            if len(self._pending_ids) < self._batch_size:
+                return
+        self.flush()
+    
+    def _submit(self, write: Callable[[], None]):
+        """Queue a write on the background writer, tracking it as this memory's latest."""
+        self._last_write = self._writer.submit(write)
+    
+    def flush(self, wait: bool = False):
+        """
+        Hand buffered conversation messages to the background writer as one add.
+        
+        Args:
+            wait: Block until ChromaDB has applied this memory's writes.
+                Writes are FIFO per shard, so this also waits for writes
+                queued earlier by other users sharing this user's shard
+        """
+        with self._pending_lock:
+            documents, metadatas, ids = self._pending_docs, self._pending_meta, self._pending_ids
+            self._pending_docs, self._pending_meta, self._pending_ids = [], [], []
+        
+        if ids:
+            self._submit(lambda: self._add_new(documents, metadatas, ids))
+        done = self._last_write
+        if wait and done is not None:
+            done.wait()
+    
+    def _embed(self, texts: List[str]) -> Optional[List[Any]]:
+        """
+        Embed texts once with the collection's embedding function.
+        
+        Returns None when the function is not exposed, in which case callers
+        pass raw text and let ChromaDB embed it.
+        """
+        if self._embed_fn is None:
+            return None
+        last_text, last_vector = self._last_query_embedding
+        missing = [text for text in texts if text != last_text]
+        vectors = dict(zip(missing, self._embed_fn(missing))) if missing else {}
+        if last_vector is not None:
+            vectors[last_text] = last_vector
+        return [vectors[text] for text in texts]
+    
+    def _add_new(self, documents: List[str], metadatas: List[Dict[str, Any]], ids: List[str]):
+        """Add documents to ChromaDB, skipping near-duplicates of stored ones."""
+        # The same vectors serve the duplicate probe and the insert
+        embeddings = self._embed(documents)
+        query = {"query_texts": documents} if embeddings is None else {"query_embeddings": embeddings}
+        
+        if self.conversations.count():
+            # One query probes the whole batch against what is already stored
+            nearest = self.conversations.query(
+                **query, n_results=1, include=["distances"]
+            )["distances"]
+            keep = [i for i, distances in enumerate(nearest)
+                    if not distances or distances[0] >= NEAR_DUPLICATE_DISTANCE]
+            if not keep:
+                return
+            documents = [documents[i] for i in keep]
+            metadatas = [metadatas[i] for i in keep]
+            ids = [ids[i] for i in keep]
+            if embeddings is not None:
+                embeddings = [embeddings[i] for i in keep]
+        self.conversations.upsert(
+            documents=documents, metadatas=metadatas, ids=ids, embeddings=embeddings
+        )
+    
+    def close(self):
+        """Write everything still buffered and wait for ChromaDB to apply it."""
+        self.flush(wait=True)
+        _live_memories.discard(self)
     
     def get_recent_messages(self, limit: int = 10) -> List[Dict[str, str]]:
         """Get recent conversation messages for context."""
-        recent = self.conversation_history[-limit:]
+        size = len(self.conversation_history)
+        recent = islice(self.conversation_history, max(size - limit, 0), size)
         return [{"role": m.role, "content": m.content} for m in recent]
     
     def get_context_for_query(self, query: str, limit: int = 5) -> str:
         """
         Retrieve relevant context for a query using semantic search.
         
+        A cheap coarse pass over-fetches candidates close to the query, then
+        the survivors are re-ranked by similarity to the recent dialogue using
+        embeddings already stored in ChromaDB, so nothing is re-embedded.
+        
         Args:
             query: User's current query
             limit: Number of relevant messages to retrieve
@@ -135,22 +426,71 @@ class FinancialMemory:
         if not self.conversations:
             return ""
         
-        try:
-            results = self.conversations.query(
-                query_texts=[query],
-                n_results=limit
+        # Make buffered and in-flight messages searchable first
+        self.flush(wait=True)
+        
+        return self._search_context(query, limit) or ""
+    
+    @_silent
+    def _search_context(self, query: str, limit: int) -> Optional[str]:
+        embeddings = self._embed([query])
+        if embeddings is None:
+            search = {"query_texts": [query]}
+        else:
+            self._last_query_embedding = (query, embeddings[0])
+            search = {"query_embeddings": embeddings}
+        results = self.conversations.query(
+            **search,
+            n_results=limit * COARSE_OVERFETCH,
+            include=["documents", "metadatas", "distances", "embeddings"]
+        )
+        
+        if not results or not results["documents"]:
+            return None
+        
+        candidates = [
+            (doc, metadata, embedding)
+            for doc, metadata, distance, embedding in zip(
+                results["documents"][0], results["metadatas"][0],
+                results["distances"][0], results["embeddings"][0]
             )
-            
-            if results and results["documents"]:
-                context_parts = []
-                for doc, metadata in zip(results["documents"][0], results["metadatas"][0]):
-                    role = metadata.get("role", "unknown")
-                    context_parts.append(f"[{role}]: {doc[:500]}")
-                return "\n".join(context_parts)
-        except Exception:
-            pass
+            if distance <= COARSE_MAX_DISTANCE
+        ]
+        candidates = self._rerank_by_recent_dialogue(candidates)[:limit]
+        
+        return "\n".join(
+            "[%s]: %s" % (metadata.get("role", "unknown"), doc[:500])
+            for doc, metadata, _ in candidates
+        )
+    
+    def _rerank_by_recent_dialogue(self, candidates: List[tuple]) -> List[tuple]:
+        """
+        Order (doc, metadata, embedding) candidates by cosine similarity to the
+        mean embedding of the last few messages, dropping weak matches.
+        
+        Candidates keep their query order when there is no recent dialogue.
+        """
+        size = len(self.conversation_history)
+        recent_ids = [
+            self._message_id(m)
+            for m in islice(self.conversation_history, max(size - RERANK_RECENT_MESSAGES, 0), size)
+        ]
+        if not candidates or not recent_ids:
+            return candidates
+        
+        recent = self.conversations.get(ids=recent_ids, include=["embeddings"])
+        if recent is None or len(recent["embeddings"]) == 0:
+            return candidates
         
-        return ""
+        import numpy as np
+        
+        current = np.mean(np.asarray(recent["embeddings"], dtype=float), axis=0)
+        matrix = np.asarray([embedding for _, _, embedding in candidates], dtype=float)
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(current)
+        scores = (matrix @ current) / np.where(norms == 0, 1.0, norms)
+        
+        order = np.argsort(-scores, kind="stable")
+        return [candidates[i] for i in order if scores[i] >= RERANK_MIN_SIMILARITY]
     
     def save_preferences(self, preferences: Dict[str, Any]):
         """
@@ -165,25 +505,34 @@ class FinancialMemory:
                 - age
         """
         self.user_preferences.update(preferences)
+        self._profile_prefix = None
         
-        if self.preferences:
-            try:
-                # Upsert preferences
-                self.preferences.upsert(
-                    documents=[json.dumps(self.user_preferences)],
-                    metadatas=[{"user_id": self.user_id}],
-                    ids=[f"prefs_{self.user_id}"]
-                )
-            except Exception:
-                pass
+        # Serialize now so the background write stores this snapshot
+        document = dumps(self.user_preferences)
+        self._submit(lambda: self._write_preferences(document))
     
     def get_preferences(self) -> Dict[str, Any]:
         """Get user's saved preferences."""
         return self.user_preferences
     
+    def get_profile_prefix(self) -> str:
+        """
+        Get the "[User profile: ...]" prompt prefix for the saved preferences.
+        
+        Rendered once and reused until preferences change; empty if none saved.
+        """
+        if self._profile_prefix is None:
+            if self.user_preferences:
+                pref_str = ", ".join([f"{k}: {v}" for k, v in self.user_preferences.items()])
+                self._profile_prefix = f"[User profile: {pref_str}]\n\n"
+            else:
+                self._profile_prefix = ""
+        return self._profile_prefix
+    
     def save_portfolio(self, portfolio: Dict[str, Any]):
         """Save user's portfolio data for reference."""
         self.portfolio_data = portfolio
+        self._portfolio_total = None
     
     def get_portfolio(self) -> Optional[Dict[str, Any]]:
         """Get user's saved portfolio."""
@@ -191,17 +540,34 @@ class FinancialMemory:
     
     def clear_history(self):
         """Clear conversation history (but keep preferences)."""
-        self.conversation_history = []
+        self.conversation_history.clear()
+        self._message_count = 0
         if self.conversations:
-            try:
-                # Delete all documents for this user
-                all_ids = self.conversations.get(
-                    where={"user_id": self.user_id}
-                )
-                if all_ids and all_ids["ids"]:
-                    self.conversations.delete(ids=all_ids["ids"])
-            except Exception:
-                pass
+            # Buffered messages are part of the history being cleared
+            with self._pending_lock:
+                self._pending_docs, self._pending_meta, self._pending_ids = [], [], []
+                self._seen_ids.clear()
+            # Queued behind earlier adds so in-flight messages are deleted too
+            self._submit(self._delete_history)
+    
+    def _delete_history(self):
+        """Delete all stored conversation documents for this user."""
+        # IDs only: skip materializing documents, metadata and embeddings
+        all_ids = self.conversations.get(
+            where={"user_id": self.user_id},
+            include=[]
+        )
+        if all_ids and all_ids["ids"]:
+            self.conversations.delete(ids=all_ids["ids"])
+    
+    def _get_portfolio_total(self) -> float:
+        """Total holding value, summed once per saved portfolio."""
+        if self._portfolio_total is None:
+            self._portfolio_total = sum(
+                float(h.get("value", 0))
+                for h in self.portfolio_data.get("holdings", [])
+            )
+        return self._portfolio_total
     
     def get_memory_summary(self) -> str:
         """Get a summary of what the memory knows about the user."""
@@ -213,12 +579,8 @@ class FinancialMemory:
                 summary_parts.append(f"- {key.replace('_', ' ').title()}: {value}")
         
         if self.portfolio_data:
-            total_value = sum(
-                float(h.get("value", 0)) 
-                for h in self.portfolio_data.get("holdings", [])
-            )
-            summary_parts.append(f"\n**Portfolio Value:** ${total_value:,.2f}")
+            summary_parts.append(f"\n**Portfolio Value:** ${self._get_portfolio_total():,.2f}")
         
-        summary_parts.append(f"\n**Conversation History:** {len(self.conversation_history)} messages")
+        summary_parts.append(f"\n**Conversation History:** {self._message_count} messages")
         
         return "\n".join(summary_parts) if summary_parts else "No user data stored yet."
@@ -0,0 +1,118 @@
+"""Shared asyncio runtime for running agent coroutines from sync code."""
+import asyncio
+import threading
+import weakref
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from config.settings import settings
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _new_event_loop() -> asyncio.AbstractEventLoop:
+    """Create the loop on uvloop when installed; it polls sockets faster than asyncio's default."""
+    try:
+        import uvloop
+    except ImportError:
+        return asyncio.new_event_loop()
+    return uvloop.new_event_loop()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Get the process-wide event loop, starting it on a daemon thread on first use."""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = _new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, name="agent-event-loop", daemon=True
+                ).start()
+                _loop = loop
+    return _loop
+
+
+def run_sync(coro: Awaitable[Any]) -> Any:
+    """
+    Run a coroutine on the shared event loop and block until it completes.
+
+    Safe to call from any number of threads (e.g. Flask workers); calls
+    overlap on the shared loop instead of each spinning up its own.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
+
+
+def iter_sync(aiterator: AsyncIterator[Any]) -> Iterator[Any]:
+    """
+    Iterate an async iterator on the shared event loop from sync code.
+
+    Each item is fetched on the loop as the caller asks for it, so a slow
+    consumer (e.g. a streaming HTTP response) applies backpressure. If the
+    caller stops early, the iterator is closed on the loop so its cleanup
+    (such as storing a partial turn) still runs.
+    """
+    loop = get_event_loop()
+
+    async def next_item() -> Any:
+        return await aiterator.__anext__()
+
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(next_item(), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        aclose = getattr(aiterator, "aclose", None)
+        if aclose is not None:
+            asyncio.run_coroutine_threadsafe(aclose(), loop).result()
+
+
+def llm_semaphore() -> asyncio.Semaphore:
+    """Get the semaphore bounding concurrent LLM calls on the running loop."""
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(settings.llm_concurrency)
+    return semaphore
+
+
+async def run_user_batches(
+    inputs: List[Tuple[str, str]],
+    agent_factory: Callable[[str], Any],
+    agents: Optional[Dict[str, Any]] = None,
+) -> List[str]:
+    """
+    Run many (user_id, message) pairs concurrently, returning replies in input order.
+
+    Different users run concurrently, bounded by settings.batch_concurrency;
+    messages for the same user run in order so their memory stays consistent.
+
+    Args:
+        inputs: (user_id, message) pairs
+        agent_factory: Creates an agent for a user_id not found in agents
+        agents: Optional existing agents by user_id; new agents are added to it
+    """
+    agents = {} if agents is None else agents
+    semaphore = asyncio.Semaphore(settings.batch_concurrency)
+    results: List[Optional[str]] = [None] * len(inputs)
+
+    by_user: Dict[str, List[Tuple[int, str]]] = {}
+    for index, (user_id, message) in enumerate(inputs):
+        by_user.setdefault(user_id, []).append((index, message))
+
+    async def run_user(user_id: str, items: List[Tuple[int, str]]):
+        if user_id not in agents:
+            # Agent construction opens the user's store; keep it off the loop
+            agents[user_id] = await asyncio.to_thread(agent_factory, user_id)
+        agent = agents[user_id]
+        for index, message in items:
+            async with semaphore:
+                results[index] = await agent.achat(message)
+
+    await asyncio.gather(*(run_user(user_id, items) for user_id, items in by_user.items()))
+    return results
@@ -1,7 +1,23 @@
 """Google Gemini AI client for Wealth Advisor."""
 import os
 import json
-from typing import Optional, Dict, Any
+import asyncio
+import functools
+import threading
+import time
+from typing import Optional, Dict, Any, AsyncIterator, Iterator, Union
+
+from config.settings import settings
+from ai.retry import backoff_delay, awith_backoff, with_backoff
+from ai.tool_protocol import (
+    TOOL_MARKER,
+    aexecute_tool_calls,
+    build_tool_prompt,
+    execute_tool_calls,
+    format_tool_results,
+    parse_tool_calls,
+    stream_until_tool_call,
+)
 
 
 class GeminiClient:
@@ -32,6 +48,9 @@ class GeminiClient:
             self.model = genai.GenerativeModel('gemini-2.0-flash-lite')
             print("✓ Gemini client initialized (gemini-2.0-flash-lite)")
             
+            if settings.llm_warmup:
+                threading.Thread(target=self._warmup, name="gemini-warmup", daemon=True).start()
+            
         except ImportError:
             print("⚠️ google-generativeai not installed. Run: pip install google-generativeai")
             self.model = None
@@ -39,37 +58,65 @@ class GeminiClient:
             print(f"⚠️ Failed to initialize Gemini: {e}")
             self.model = None
     
+    def _warmup(self):
+        """Open the API connection with a one-token request so the first turn skips the handshake."""
+        try:
+            self.model.generate_content("ping", generation_config={"max_output_tokens": 1})
+        except Exception:
+            pass
+    
     @property
     def is_available(self) -> bool:
         """Check if Gemini is available."""
         return self.model is not None
     
-    def generate(self, prompt: str, system_prompt: str = "") -> str:
+    def generate(
+        self, prompt: str, system_prompt: str = "", stream: bool = False
+    ) -> Union[str, Iterator[str]]:
         """
         Generate a response using Gemini with retries.
+        
+        Args:
+            prompt: User prompt
+            system_prompt: System instructions
+            stream: Return an iterator of text chunks as they are generated,
+                so the caller can render before the whole response is done
         """
         if not self.model:
-            return "Gemini is not configured. Please set GOOGLE_API_KEY."
+            message = "Gemini is not configured. Please set GOOGLE_API_KEY."
+            return iter([message]) if stream else message
         
-        import time
+        # Combine system and user prompts
+        full_prompt = f"{system_prompt}\n\nUser: {prompt}" if system_prompt else prompt
+        
+        if stream:
+            return self._stream_generate(full_prompt)
+        
+        def attempt() -> str:
+            return self.model.generate_content(full_prompt).text
+        
+        return with_backoff(attempt, error_prefix="Error generating response: ")
+    
+    def _stream_generate(self, full_prompt: str) -> Iterator[str]:
+        """Yield response chunks; rate limits are retried until the first chunk arrives."""
         max_retries = 3
+        chunks = []
         
         for attempt in range(max_retries):
             try:
-                # Combine system and user prompts
-                full_prompt = f"{system_prompt}\n\nUser: {prompt}" if system_prompt else prompt
-                
-                response = self.model.generate_content(full_prompt)
-                return response.text
+                for chunk in self.model.generate_content(full_prompt, stream=True):
+                    chunks.append(chunk.text)
+                    yield chunk.text
+                return
                 
             except Exception as e:
-                if "429" in str(e) and attempt < max_retries - 1:
-                    wait_time = 5 * (2 ** attempt)  # Exponential: 5s, 10s, 20s
-                    print(f"⚠️ Rate limit hit. Retrying in {wait_time}s...")
+                wait_time = None if chunks else backoff_delay(e, attempt, max_retries, 5)
+                if wait_time is not None:
                     time.sleep(wait_time)
                     continue
-                return f"Error generating response: {str(e)}"
-        return "Error: Maximum retries exceeded."
+                yield f"Error generating response: {str(e)}"
+                return
+        yield "Error: Maximum retries exceeded."
     
     def generate_with_tools(
         self, 
@@ -91,86 +138,114 @@ class GeminiClient:
         if not self.model:
             return "Gemini is not configured. Please set GOOGLE_API_KEY."
         
-        # Create tool descriptions
-        tool_descriptions = "\n".join([
-            f"- {name}: {func.__doc__ or 'No description'}"
-            for name, func in tools.items()
-        ])
-        
-        # Enhanced prompt with tool instructions
-        enhanced_prompt = f"""
-{system_prompt}
-
-You have access to these tools:
-{tool_descriptions}
-
-To use a tool, respond with:
-TOOL: <tool_name>
-INPUT: <json_input>
-
-After seeing the tool result, provide your final answer.
-
-User query: {prompt}
-"""
-        import time
-        max_retries = 3
+        enhanced_prompt = build_tool_prompt(prompt, tools, system_prompt)
         
-        for attempt in range(max_retries):
-            try:
-                response = self.model.generate_content(enhanced_prompt)
-                text = response.text
+        def attempt() -> str:
+            text = self.model.generate_content(enhanced_prompt).text
+            
+            # Check if model wants to use one or more tools
+            calls = [(name, inp) for name, inp in parse_tool_calls(text) if name in tools]
+            if calls:
+                # Execute tools
+                results = execute_tool_calls(calls, tools)
                 
-                # Check if model wants to use a tool
-                if "TOOL:" in text and "INPUT:" in text:
-                    # Parse tool call
-                    lines = text.split("\n")
-                    tool_name = None
-                    tool_input = None
-                    
-                    for i, line in enumerate(lines):
-                        if line.startswith("TOOL:"):
-                            tool_name = line.replace("TOOL:", "").strip()
-                        elif line.startswith("INPUT:"):
-                            # Get everything after INPUT:
-                            tool_input = line.replace("INPUT:", "").strip()
-                            # Try to get multi-line JSON
-                            if not tool_input.endswith("}"):
-                                for j in range(i+1, len(lines)):
-                                    tool_input += lines[j]
-                                    if "}" in lines[j]:
-                                        break
-                    
-                    if tool_name and tool_name in tools:
-                        # Execute tool
-                        tool_func = tools[tool_name]
-                        try:
-                            result = tool_func(tool_input or "{}")
-                        except Exception as e:
-                            result = f"Tool error: {str(e)}"
-                        
-                        # Get final response with tool result
-                        followup = f"""
-Tool result for {tool_name}:
-{result}
-
-Now provide a helpful response to the user based on this result.
-"""
-                        final_response = self.model.generate_content(followup)
-                        return final_response.text
+                # Get final response with tool results
+                followup = format_tool_results(calls, results)
+                return self.model.generate_content(followup).text
+            
+            return text
+        
+        return with_backoff(attempt)
+    
+    async def agenerate(self, prompt: str, system_prompt: str = "") -> str:
+        """
+        Async variant of generate() that does not block the event loop.
+        """
+        if not self.model:
+            return "Gemini is not configured. Please set GOOGLE_API_KEY."
+        
+        full_prompt = f"{system_prompt}\n\nUser: {prompt}" if system_prompt else prompt
+        
+        async def attempt() -> str:
+            return (await self.model.generate_content_async(full_prompt)).text
+        
+        return await awith_backoff(attempt, error_prefix="Error generating response: ")
+    
+    async def agenerate_with_tools(
+        self, 
+        prompt: str, 
+        tools: Dict[str, callable],
+        system_prompt: str = ""
+    ) -> str:
+        """
+        Async variant of generate_with_tools().
+        
+        Tools are plain sync functions, so they run in worker threads; a batch
+        of independent tool calls runs concurrently.
+        """
+        if not self.model:
+            return "Gemini is not configured. Please set GOOGLE_API_KEY."
+        
+        enhanced_prompt = build_tool_prompt(prompt, tools, system_prompt)
+        
+        async def attempt() -> str:
+            text = (await self.model.generate_content_async(enhanced_prompt)).text
+            
+            calls = [(name, inp) for name, inp in parse_tool_calls(text) if name in tools]
+            if calls:
+                results = await aexecute_tool_calls(calls, tools)
                 
-                return text
+                followup = format_tool_results(calls, results)
+                return (await self.model.generate_content_async(followup)).text
+            
+            return text
+        
+        return await awith_backoff(attempt)
+    
+    async def _astream_text(self, prompt: str) -> AsyncIterator[str]:
+        response = await self.model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            yield chunk.text
+    
+    async def astream_with_tools(
+        self, 
+        prompt: str, 
+        tools: Dict[str, callable],
+        system_prompt: str = ""
+    ) -> AsyncIterator[str]:
+        """
+        Streaming variant of agenerate_with_tools().
+        
+        Yields answer text as it is generated. If the model requests tools,
+        they run once its request is complete and the follow-up is streamed.
+        """
+        if not self.model:
+            yield "Gemini is not configured. Please set GOOGLE_API_KEY."
+            return
+        
+        enhanced_prompt = build_tool_prompt(prompt, tools, system_prompt)
+        collected = []
+        
+        try:
+            async for chunk in stream_until_tool_call(self._astream_text(enhanced_prompt), collected):
+                yield chunk
+            
+            text = "".join(collected)
+            calls = [(name, inp) for name, inp in parse_tool_calls(text) if name in tools]
+            if calls:
+                results = await aexecute_tool_calls(calls, tools)
+                async for chunk in self._astream_text(format_tool_results(calls, results)):
+                    yield chunk
+            elif TOOL_MARKER in text:
+                # Not a usable tool call after all; pass the text through
+                yield text[text.index(TOOL_MARKER):]
                 
-            except Exception as e:
-                if "429" in str(e) and attempt < max_retries - 1:
-                    wait_time = 5 * (2 ** attempt)  # Exponential: 5s, 10s, 20s
-                    print(f"⚠️ Rate limit hit. Retrying in {wait_time}s...")
-                    time.sleep(wait_time)
-                    continue
-                return f"Error: {str(e)}"
-        return "Error: Maximum retries exceeded."
+        except Exception as e:
+            yield f"Error: {str(e)}"
 
 
 # Create default client
+@functools.cache
 def get_gemini_client() -> GeminiClient:
-    """Get or create Gemini client."""
+    """Get or create the process-wide Gemini client shared by all agents."""
     return GeminiClient()
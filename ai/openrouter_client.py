@@ -1,9 +1,44 @@
 """OpenRouter client for Wealth Advisor."""
 import os
 import json
-import time
-from typing import Optional, Dict, Any
+import asyncio
+import atexit
+import functools
+from typing import Optional, Dict, Any, AsyncIterator
 from config.settings import settings
+from ai.retry import awith_backoff, with_backoff
+from ai.tool_protocol import (
+    TOOL_MARKER,
+    aexecute_tool_calls,
+    build_tool_prompt,
+    execute_tool_calls,
+    format_tool_results,
+    parse_tool_calls,
+    stream_until_tool_call,
+)
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+OPENROUTER_HEADERS = {
+    "HTTP-Referer": "https://cryptoaion.com", # Optional but requested by OpenRouter
+    "X-Title": "Wealth Advisor",
+}
+
+# Keep-alive pool shared by all requests from one client
+HTTP_POOL_LIMITS = {"max_keepalive_connections": 32, "max_connections": 128}
+HTTP_TIMEOUT = 60.0
+
+# First rate-limit retry delay in seconds; doubles on each further attempt
+RETRY_BASE_DELAY = 2
+
+
+def _http2_available() -> bool:
+    """HTTP/2 in httpx needs the optional h2 package."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
 
 class OpenRouterClient:
     """Client for OpenRouter API."""
@@ -12,14 +47,28 @@ class OpenRouterClient:
         self.api_key = api_key or settings.openrouter_api_key
         self.model_name = model or settings.openrouter_model
         self.client = None
+        self.async_client = None
         
         if self.api_key:
             try:
-                from openai import OpenAI
+                import httpx
+                from openai import OpenAI, AsyncOpenAI
+                
+                # Explicit long-lived pools: keep-alive (and HTTP/2 when
+                # available) so turns reuse connections instead of new TLS handshakes
+                http2 = _http2_available()
+                limits = httpx.Limits(**HTTP_POOL_LIMITS)
                 self.client = OpenAI(
-                    base_url="https://openrouter.ai/api/v1",
+                    base_url=OPENROUTER_BASE_URL,
                     api_key=self.api_key,
+                    http_client=httpx.Client(http2=http2, limits=limits, timeout=HTTP_TIMEOUT),
                 )
+                self.async_client = AsyncOpenAI(
+                    base_url=OPENROUTER_BASE_URL,
+                    api_key=self.api_key,
+                    http_client=httpx.AsyncClient(http2=http2, limits=limits, timeout=HTTP_TIMEOUT),
+                )
+                atexit.register(self.client.close)
                 print(f"✓ OpenRouter client initialized ({self.model_name})")
             except ImportError:
                 print("⚠️ openai package not installed.")
@@ -30,28 +79,64 @@ class OpenRouterClient:
     def is_available(self) -> bool:
         return self.client is not None
         
-    def generate(self, prompt: str, system_prompt: str = "") -> str:
-        if not self.client:
-            return "OpenRouter not configured."
-            
+    @staticmethod
+    def _build_messages(prompt: str, system_prompt: str = "") -> list:
         messages = []
         if system_prompt:
             messages.append({"role": "system", "content": system_prompt})
         messages.append({"role": "user", "content": prompt})
+        return messages
+        
+    def _complete(self, messages: list) -> str:
+        """One chat completion."""
+        response = self.client.chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            extra_headers=OPENROUTER_HEADERS,
+        )
+        return response.choices[0].message.content
+    
+    async def _acomplete(self, messages: list) -> str:
+        """Async variant of _complete()."""
+        response = await self.async_client.chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            extra_headers=OPENROUTER_HEADERS,
+        )
+        return response.choices[0].message.content
+    
+    def generate(self, prompt: str, system_prompt: str = "") -> str:
+        if not self.client:
+            return "OpenRouter not configured."
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=messages,
-                extra_headers={
-                    "HTTP-Referer": "https://cryptoaion.com", # Optional but requested by OpenRouter
-                    "X-Title": "Wealth Advisor",
-                },
-            )
-            return response.choices[0].message.content
+            return self._complete(self._build_messages(prompt, system_prompt))
+        except Exception as e:
+            return f"Error: {str(e)}"
+    
+    async def agenerate(self, prompt: str, system_prompt: str = "") -> str:
+        """Async variant of generate() that does not block the event loop."""
+        if not self.async_client:
+            return "OpenRouter not configured."
+        
+        try:
+            return await self._acomplete(self._build_messages(prompt, system_prompt))
         except Exception as e:
             return f"Error: {str(e)}"
 
+    @staticmethod
+    def _tool_followup_messages(messages: list, response_text: str, result: str) -> list:
+        """
+        Extend the first-round messages with the tool exchange.
+        
+        The system prompt is already part of the tool prompt, so it is not
+        sent again as a separate system message.
+        """
+        return messages + [
+            {"role": "assistant", "content": response_text},
+            {"role": "user", "content": f"{result}\n\nPlease continue."}
+        ]
+    
     def generate_with_tools(
         self, 
         prompt: str, 
@@ -64,89 +149,112 @@ class OpenRouterClient:
         if not self.client:
             return "OpenRouter not configured."
         
-        # Create tool descriptions
-        tool_descriptions = "\n".join([
-            f"- {name}: {func.__doc__ or 'No description'}"
-            for name, func in tools.items()
-        ])
+        messages = self._build_messages(build_tool_prompt(prompt, tools, system_prompt))
         
-        # Enhanced prompt with tool instructions
-        enhanced_prompt = f"""
-{system_prompt}
-
-You have access to these tools:
-{tool_descriptions}
-
-To use a tool, respond with:
-TOOL: <tool_name>
-INPUT: <json_input>
-
-After seeing the tool result, provide your final answer.
-
-User query: {prompt}
-"""
-        
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                response_text = self.generate(enhanced_prompt)
+        def attempt() -> str:
+            response_text = self._complete(messages)
+            
+            # Check if model wants to use one or more tools
+            calls = [(name, inp) for name, inp in parse_tool_calls(response_text) if name in tools]
+            if calls:
+                # Execute tools
+                result = format_tool_results(calls, execute_tool_calls(calls, tools))
                 
-                # Check if model wants to use a tool
-                if "TOOL:" in response_text and "INPUT:" in response_text:
-                    # Parse tool call
-                    lines = response_text.split("\n")
-                    tool_name = None
-                    tool_input = None
-                    
-                    for i, line in enumerate(lines):
-                        if line.startswith("TOOL:"):
-                            tool_name = line.replace("TOOL:", "").strip()
-                        elif line.startswith("INPUT:"):
-                            tool_input = line.replace("INPUT:", "").strip()
-                            if not tool_input.endswith("}"):
-                                for j in range(i+1, len(lines)):
-                                    tool_input += lines[j]
-                                    if "}" in lines[j]:
-                                        break
-                    
-                    if tool_name and tool_name in tools:
-                        # Execute tool
-                        tool_func = tools[tool_name]
-                        try:
-                            result = tool_func(tool_input or "{}")
-                        except Exception as e:
-                            result = f"Tool error: {str(e)}"
-                        
-                        # Get final response with tool result
-                        followup = f"""
-Tool result for {tool_name}:
-{result}
-
-Now provide a helpful response to the user based on this result.
-"""
-                        # We append the tool interaction to history effectively by making a new call
-                        # Ideally we should maintain message history, but fitting into the current 'generate' valid interface
-                        # We will just do a simplified follow-up.
-                        
-                        # Ideally pass the full history back.
-                        messages = [
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": enhanced_prompt},
-                            {"role": "assistant", "content": response_text},
-                            {"role": "user", "content": f"Tool result: {result}\n\nPlease continue."}
-                        ]
-                        
-                        followup_response = self.client.chat.completions.create(
-                            model=self.model_name,
-                            messages=messages
-                        )
-                        return followup_response.choices[0].message.content
+                # Pass the tool interaction back as message history
+                return self._complete(
+                    self._tool_followup_messages(messages, response_text, result)
+                )
+            
+            return response_text
+        
+        return with_backoff(attempt, base_delay=RETRY_BASE_DELAY)
+    
+    async def agenerate_with_tools(
+        self, 
+        prompt: str, 
+        tools: Dict[str, callable],
+        system_prompt: str = ""
+    ) -> str:
+        """
+        Async variant of generate_with_tools().
+        
+        Tools are plain sync functions, so they run in worker threads; a batch
+        of independent tool calls runs concurrently.
+        """
+        if not self.async_client:
+            return "OpenRouter not configured."
+        
+        messages = self._build_messages(build_tool_prompt(prompt, tools, system_prompt))
+        
+        async def attempt() -> str:
+            response_text = await self._acomplete(messages)
+            
+            calls = [(name, inp) for name, inp in parse_tool_calls(response_text) if name in tools]
+            if calls:
+                results = await aexecute_tool_calls(calls, tools)
+                result = format_tool_results(calls, results)
                 
-                return response_text
+                return await self._acomplete(
+                    self._tool_followup_messages(messages, response_text, result)
+                )
+            
+            return response_text
+        
+        return await awith_backoff(attempt, base_delay=RETRY_BASE_DELAY)
+    
+    async def _astream_messages(self, messages: list) -> AsyncIterator[str]:
+        stream = await self.async_client.chat.completions.create(
+            model=self.model_name,
+            messages=messages,
+            extra_headers=OPENROUTER_HEADERS,
+            stream=True,
+        )
+        async for event in stream:
+            if event.choices and event.choices[0].delta.content:
+                yield event.choices[0].delta.content
+    
+    async def astream_with_tools(
+        self, 
+        prompt: str, 
+        tools: Dict[str, callable],
+        system_prompt: str = ""
+    ) -> AsyncIterator[str]:
+        """
+        Streaming variant of agenerate_with_tools().
+        
+        Yields answer text as it is generated. If the model requests tools,
+        they run once its request is complete and the follow-up is streamed.
+        """
+        if not self.async_client:
+            yield "OpenRouter not configured."
+            return
+        
+        messages = self._build_messages(build_tool_prompt(prompt, tools, system_prompt))
+        collected = []
+        
+        try:
+            first = self._astream_messages(messages)
+            async for chunk in stream_until_tool_call(first, collected):
+                yield chunk
+            
+            response_text = "".join(collected)
+            calls = [(name, inp) for name, inp in parse_tool_calls(response_text) if name in tools]
+            if calls:
+                results = await aexecute_tool_calls(calls, tools)
+                followup = self._tool_followup_messages(
+                    messages, response_text, format_tool_results(calls, results)
+                )
+                async for chunk in self._astream_messages(followup):
+                    yield chunk
+            elif TOOL_MARKER in response_text:
+                # Not a usable tool call after all; pass the text through
+                yield response_text[response_text.index(TOOL_MARKER):]
                 
-            except Exception as e:
-                if "429" in str(e) and attempt < max_retries - 1:
-                    time.sleep(2)
-                    continue
-                return f"Error: {str(e)}"
-        return "Error: Maximum retries exceeded."
+        except Exception as e:
+            yield f"Error: {str(e)}"
+
+
+@functools.cache
+def get_openrouter_client() -> OpenRouterClient:
+    """Get the process-wide OpenRouter client (one connection pool shared by all agents)."""
+    return OpenRouterClient()
@@ -0,0 +1,54 @@
+"""Rate-limit retry with exponential backoff for LLM calls."""
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+
+def backoff_delay(error: Exception, attempt: int, max_retries: int, base_delay: float):
+    """Seconds to wait before retrying, or None if the error should be returned."""
+    if "429" in str(error) and attempt < max_retries - 1:
+        wait_time = base_delay * (1 << attempt)  # Exponential: base, 2x, 4x
+        print(f"⚠️ Rate limit hit. Retrying in {wait_time}s...")
+        return wait_time
+    return None
+
+
+def with_backoff(
+    fn: Callable[[], str],
+    max_retries: int = 3,
+    base_delay: float = 5,
+    error_prefix: str = "Error: ",
+) -> str:
+    """
+    Call fn, retrying on rate limits (HTTP 429) with exponential backoff.
+
+    Any other error, or a rate limit on the last attempt, is returned as
+    an error string rather than raised.
+    """
+    for attempt in range(max_retries):
+        try:
+            return fn()
+        except Exception as e:
+            wait_time = backoff_delay(e, attempt, max_retries, base_delay)
+            if wait_time is None:
+                return f"{error_prefix}{str(e)}"
+            time.sleep(wait_time)
+    return "Error: Maximum retries exceeded."
+
+
+async def awith_backoff(
+    fn: Callable[[], Awaitable[str]],
+    max_retries: int = 3,
+    base_delay: float = 5,
+    error_prefix: str = "Error: ",
+) -> str:
+    """Async variant of with_backoff(); waits without blocking the event loop."""
+    for attempt in range(max_retries):
+        try:
+            return await fn()
+        except Exception as e:
+            wait_time = backoff_delay(e, attempt, max_retries, base_delay)
+            if wait_time is None:
+                return f"{error_prefix}{str(e)}"
+            await asyncio.sleep(wait_time)
+    return "Error: Maximum retries exceeded."
@@ -0,0 +1,225 @@
+"""Text protocol for LLM tool calls (TOOL: / INPUT: blocks)."""
+import asyncio
+import json
+import re
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from utils.fast_json import dumps
+
+
+TOOL_FOLLOWUP_TEMPLATE = """
+Tool result for {tool_name}:
+{result}
+
+Now provide a helpful response to the user based on this result.
+"""
+
+BATCH_TOOL_FOLLOWUP_TEMPLATE = """
+TOOL_RESULTS:
+{results}
+
+Now provide a helpful response to the user based on these results.
+"""
+
+# Pseudo-tool name for requesting several independent tools in one turn
+BATCH_TOOL_NAME = "batch"
+
+TOOL_MARKER = "TOOL:"
+
+# TOOL: <name> at the start of a line, then the next line-initial INPUT:.
+# The input runs to the end of its line when that line closes the JSON,
+# otherwise on to the end of the first line containing a "}".
+_TOOL_CALL_RE = re.compile(
+    r"^TOOL:[ \t]*(?P<tool>[^\n]*?)[ \t]*\n(?:[^\n]*\n)*?"
+    r"INPUT:[ \t]*(?P<input>[^\n]*?\}[ \t]*$|[^}]*\}?[^\n]*)",
+    re.MULTILINE,
+)
+
+
+# (id(tools), system_prompt) -> (tools, prompt text up to the user query).
+# The tools mapping is kept alive in the value so its id cannot be reused.
+_TOOL_PROMPT_PREFIXES: Dict[Tuple[int, str], Tuple[Dict[str, callable], str]] = {}
+
+
+def _tool_prompt_prefix(tools: Dict[str, callable], system_prompt: str) -> str:
+    """Render the tool prompt up to the user query once per tools mapping."""
+    key = (id(tools), system_prompt)
+    cached = _TOOL_PROMPT_PREFIXES.get(key)
+    if cached is not None and cached[0] is tools:
+        return cached[1]
+
+    tool_descriptions = "\n".join([
+        f"- {name}: {func.__doc__ or 'No description'}"
+        for name, func in tools.items()
+    ])
+
+    prefix = f"""
+{system_prompt}
+
+You have access to these tools:
+{tool_descriptions}
+
+To use a tool, respond with:
+TOOL: <tool_name>
+INPUT: <json_input>
+
+To use several independent tools at once, respond with:
+TOOL: batch
+INPUT: {{"batch": [{{"tool": "<tool_name>", "input": <json_input>}}, ...]}}
+
+After seeing the tool result, provide your final answer.
+
+User query: """
+    _TOOL_PROMPT_PREFIXES[key] = (tools, prefix)
+    return prefix
+
+
+def build_tool_prompt(prompt: str, tools: Dict[str, callable], system_prompt: str = "") -> str:
+    """
+    Build the user prompt that describes available tools and the call format.
+
+    Everything but the user query is cached per tools mapping and system
+    prompt, so tools mappings are expected not to change after first use.
+    """
+    return f"{_tool_prompt_prefix(tools, system_prompt)}{prompt}\n"
+
+
+_json_decoder = json.JSONDecoder()
+
+
+def _slice_input(text: str, match: "re.Match") -> str:
+    """
+    Get a tool call's input, slicing JSON payloads at their exact end.
+
+    The regex only approximates where multi-line JSON stops (the first
+    line with a "}"), so payloads that open with a bracket are measured
+    with raw_decode and sliced straight out of the response text.
+    """
+    start = match.start("input")
+    if text.startswith(("{", "["), start):
+        try:
+            _, end = _json_decoder.raw_decode(text, start)
+            return text[start:end]
+        except ValueError:
+            pass
+    return match["input"].strip()
+
+
+def parse_tool_call(text: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Extract the first tool call from model output.
+
+    Returns:
+        (tool_name, tool_input) or (None, None) if the text has no tool call
+    """
+    match = _TOOL_CALL_RE.search(text)
+    if match is None:
+        return None, None
+    return match["tool"], _slice_input(text, match)
+
+
+def _expand_batch(text: str, start: int) -> List[Tuple[str, str]]:
+    """Decode a batch payload starting at text[start] into (tool, input) pairs."""
+    # Batch JSON often spans several lines, so decode from the INPUT: payload
+    try:
+        payload, _ = _json_decoder.raw_decode(text, start)
+        batch = payload.get("batch", [])
+    except (ValueError, AttributeError):
+        return []
+
+    calls = []
+    for call in batch:
+        if not isinstance(call, dict) or "tool" not in call:
+            continue
+        call_input = call.get("input", {})
+        if not isinstance(call_input, str):
+            call_input = dumps(call_input)
+        calls.append((call["tool"], call_input))
+    return calls
+
+
+def parse_tool_calls(text: str) -> List[Tuple[str, str]]:
+    """
+    Extract every tool call from model output, expanding batch requests.
+
+    Returns:
+        List of (tool_name, tool_input) pairs; empty if the text has no tool call
+    """
+    calls = []
+    for match in _TOOL_CALL_RE.finditer(text):
+        tool_name = match["tool"]
+        if not tool_name:
+            continue
+        if tool_name == BATCH_TOOL_NAME:
+            calls.extend(_expand_batch(text, match.start("input")))
+        else:
+            calls.append((tool_name, _slice_input(text, match) or "{}"))
+    return calls
+
+
+def _run_tool(tools: Dict[str, callable], tool_name: str, tool_input: str) -> str:
+    try:
+        return tools[tool_name](tool_input)
+    except Exception as e:
+        return f"Tool error: {str(e)}"
+
+
+def execute_tool_calls(calls: List[Tuple[str, str]], tools: Dict[str, callable]) -> List[str]:
+    """Run tool calls one after another."""
+    return [_run_tool(tools, name, tool_input) for name, tool_input in calls]
+
+
+async def aexecute_tool_calls(calls: List[Tuple[str, str]], tools: Dict[str, callable]) -> List[str]:
+    """
+    Run independent tool calls concurrently.
+
+    Tools are plain sync functions, so each runs in a worker thread and the
+    batch takes as long as the slowest call rather than the sum of all calls.
+    """
+    return await asyncio.gather(*[
+        asyncio.to_thread(_run_tool, tools, name, tool_input)
+        for name, tool_input in calls
+    ])
+
+
+def format_tool_results(calls: List[Tuple[str, str]], results: List[str]) -> str:
+    """Build the follow-up prompt that feeds tool output back to the model."""
+    if len(calls) == 1:
+        return TOOL_FOLLOWUP_TEMPLATE.format(tool_name=calls[0][0], result=results[0])
+
+    return BATCH_TOOL_FOLLOWUP_TEMPLATE.format(results="\n\n".join(
+        f"[{name}]\n{result}" for (name, _), result in zip(calls, results)
+    ))
+
+
+async def stream_until_tool_call(
+    chunks: AsyncIterator[str], collected: List[str]
+) -> AsyncIterator[str]:
+    """
+    Forward streamed model text until a tool call begins.
+
+    Every chunk is appended to `collected` so the caller can parse the full
+    response afterwards. Text from the TOOL: marker onwards is never yielded;
+    a few trailing characters are held back so a marker split across chunks
+    does not leak.
+    """
+    emitted = 0
+    text = ""
+    async for chunk in chunks:
+        collected.append(chunk)
+        if emitted < 0:
+            continue
+        text += chunk
+        marker = text.find(TOOL_MARKER)
+        if marker >= 0:
+            if marker > emitted:
+                yield text[emitted:marker]
+            emitted = -1
+            continue
+        safe = len(text) - (len(TOOL_MARKER) - 1)
+        if safe > emitted:
+            yield text[emitted:safe]
+            emitted = safe
+
+    if 0 <= emitted < len(text):
+        yield text[emitted:]
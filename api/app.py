@@ -1,42 +1,297 @@
 """Flask API for Wealth Management Chatbot."""
 import os
 import sys
+import logging
+import functools
+import threading
 
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from flask import Flask, request, jsonify, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from typing import Dict, Any
-import json
+from collections import OrderedDict
+from dataclasses import dataclass, fields as dataclass_fields
+from typing import Dict, Any, Optional
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
 
 from config.settings import settings
+from utils.fast_json import dumps, dumps_bytes, loads
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Parse request bodies and render jsonify() responses with orjson."""
+    
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        # Always compact; pretty-printing roughly doubles serialization time
+        return dumps(obj, default=self.default)
+    
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return loads(s)
+
+
+# Library modules log through `logging`; send it to stderr once, here
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
+# Largest request body accepted by the API
+MAX_REQUEST_BYTES = 1024 * 1024
 
 app = Flask(__name__, static_folder='../ui', static_url_path='')
-CORS(app)
+app.json = FastJSONProvider(app)
+app.config["MAX_CONTENT_LENGTH"] = MAX_REQUEST_BYTES
+
+# Serve the UI from WhiteNoise when available: files are indexed once at
+# startup and sent through wsgi.file_wrapper (sendfile under gunicorn),
+# never reaching Flask. The routes below remain as the fallback.
+try:
+    from whitenoise import WhiteNoise
+    app.wsgi_app = WhiteNoise(app.wsgi_app, root=app.static_folder, index_file=True)
+except ImportError:
+    pass
+
+# Compress JSON responses when flask-compress is installed; bodies under 1 KB
+# go out as-is, and level 4 keeps CPU cost low at a near-default ratio
+try:
+    from flask_compress import Compress
+    app.config.update(
+        COMPRESS_ALGORITHM=["br", "gzip"],
+        COMPRESS_MIN_SIZE=1024,
+        COMPRESS_LEVEL=4,
+        COMPRESS_BR_LEVEL=4,
+        # Compressors buffer; streamed chat replies must reach the client as generated
+        COMPRESS_STREAMS=False,
+    )
+    Compress(app)
+except ImportError:
+    pass
+
+# Only the API is cross-origin; browsers may reuse a preflight for a day
+CORS(app, resources={r"/api/*": {"origins": settings.cors_origins}}, max_age=86400)
+
+def _resolve_factory():
+    """Pick the agent class for the configured model, importing it once."""
+    if settings.primary_model == "openrouter" or (settings.google_api_key and settings.primary_model == "gemini"):
+        # Use Generic Agent (Gemini/OpenRouter) - from separate file with no LangChain deps
+        from agent.gemini_agent import GeminiWealthAdvisorAgent
+        return GeminiWealthAdvisorAgent
+    if settings.openai_configured:
+        # Use OpenAI - from chains.py (has LangChain deps)
+        from agent.chains import create_wealth_agent
+        return create_wealth_agent
+    # Use demo agent (works without any API key)
+    from agent.gemini_agent import DemoWealthAdvisorAgent
+    return DemoWealthAdvisorAgent
+
+
+# Resolved at startup so a new user costs one constructor call
+_agent_factory = _resolve_factory()
 
-# Store agent instances per user session
-agents: Dict[str, Any] = {}
+# Store agent instances per user session, least recently used first;
+# bounded so that many distinct user_ids cannot exhaust memory
+agents: "OrderedDict[str, Any]" = OrderedDict()
+_agents_lock = threading.Lock()
+# Held while a user's agent is being built; removed once it is stored
+_creation_locks: Dict[str, threading.Lock] = {}
+
+# Serialized /api/memory bodies per user; dropped whenever that user's data changes
+_memory_responses: Dict[str, bytes] = {}
+# Bumped by every drop. A body built while it changed may predate the write
+# that caused the drop, so it is served but not stored
+_memory_generation = 0
+_memory_lock = threading.Lock()
+
+
+def _invalidate_memory(user_id: str):
+    """Drop a user's stored /api/memory body after their data changed."""
+    global _memory_generation
+    with _memory_lock:
+        _memory_generation += 1
+        _memory_responses.pop(user_id, None)
+
+
+def _cached_agent(user_id: str):
+    """Return the stored agent, marking it most recently used (caller holds _agents_lock)."""
+    agent = agents.get(user_id)
+    if agent is not None:
+        agents.move_to_end(user_id)
+    return agent
 
 
 def get_agent(user_id: str):
-    """Get or create agent for user."""
-    if user_id not in agents:
-        # Check which model to use
-        if settings.primary_model == "openrouter" or (settings.google_api_key and settings.primary_model == "gemini"):
-            # Use Generic Agent (Gemini/OpenRouter) - from separate file with no LangChain deps
-            from agent.gemini_agent import GeminiWealthAdvisorAgent
-            agents[user_id] = GeminiWealthAdvisorAgent(user_id)
-        elif settings.openai_api_key and settings.openai_api_key != "your_openai_api_key_here":
-            # Use OpenAI - from chains.py (has LangChain deps)
-            from agent.chains import create_wealth_agent
-            agents[user_id] = create_wealth_agent(user_id)
-        else:
-            # Use demo agent (works without any API key)
-            from agent.gemini_agent import DemoWealthAdvisorAgent
-            agents[user_id] = DemoWealthAdvisorAgent(user_id)
-    return agents[user_id]
+    """
+    Get or create agent for user, evicting the least recently used past the cap.
+    
+    Construction runs under a per-user lock, so concurrent first requests
+    for one user build a single agent while other users are not blocked.
+    """
+    with _agents_lock:
+        agent = _cached_agent(user_id)
+        if agent is not None:
+            return agent
+        creation_lock = _creation_locks.setdefault(user_id, threading.Lock())
+    
+    with creation_lock:
+        with _agents_lock:
+            agent = _cached_agent(user_id)
+        if agent is not None:
+            return agent
+        
+        evicted = None
+        try:
+            agent = _agent_factory(user_id)
+        finally:
+            with _agents_lock:
+                if agent is not None:
+                    agents[user_id] = agent
+                    if len(agents) > settings.agent_cache_max:
+                        _, evicted = agents.popitem(last=False)
+                _creation_locks.pop(user_id, None)
+    
+    if evicted is not None:
+        _invalidate_memory(evicted.user_id)
+        # Outside the locks: flushing may wait on ChromaDB
+        evicted.close()
+    return agent
+
+
+if msgspec is not None:
+    class ChatRequest(msgspec.Struct):
+        """Body of POST /api/chat, decoded and type-checked by msgspec in one step."""
+        message: str
+        user_id: str = "default"
+else:
+    @dataclass(slots=True)
+    class ChatRequest:
+        """Body of POST /api/chat."""
+        message: str
+        user_id: str = "default"
+
+
+def require_json(*fields: str, error: Optional[str] = None, body_type: Optional[type] = None):
+    """
+    Parse the JSON object body once and pass it to the view as ``data``.
+    
+    Bodies over MAX_REQUEST_BYTES get a 413, decided from Content-Length
+    before anything is read when the header is sent. An empty body counts
+    as {}; requests missing any of ``fields`` get a 400 with ``error``.
+    With ``body_type``, ``data`` is an instance of it: decoded directly by
+    msgspec when installed, otherwise built from the parsed dict. msgspec
+    validation errors about one of ``fields`` also use ``error``; others
+    keep msgspec's own message.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            length = request.content_length
+            if length is not None and length > MAX_REQUEST_BYTES:
+                return jsonify({"error": "Request body too large"}), 413
+            raw = request.get_data(cache=False)
+            if length is None and len(raw) >= MAX_REQUEST_BYTES:
+                # Chunked bodies have no Content-Length; the read stops at the limit
+                return jsonify({"error": "Request body too large"}), 413
+            if body_type is not None and msgspec is not None:
+                try:
+                    data = msgspec.json.decode(raw or b"{}", type=body_type)
+                except msgspec.ValidationError as e:
+                    # msgspec names the field in backticks: "missing required
+                    # field `message`" or "... - at `$.message`"
+                    detail = str(e)
+                    if error and any(f"`{f}`" in detail or f"`$.{f}`" in detail for f in fields):
+                        detail = error
+                    return jsonify({"error": detail}), 400
+                except msgspec.DecodeError:
+                    return jsonify({"error": "Invalid JSON body"}), 400
+                return view(data, *args, **kwargs)
+            
+            try:
+                data = loads(raw) if raw else {}
+            except ValueError:
+                return jsonify({"error": "Invalid JSON body"}), 400
+            
+            if not isinstance(data, dict):
+                return jsonify({"error": "JSON object body is required"}), 400
+            missing = [f for f in fields if f not in data]
+            if missing:
+                return jsonify({"error": error or f"Missing fields: {', '.join(missing)}"}), 400
+            if body_type is not None:
+                # Reject wrongly typed fields with a 400, as msgspec would
+                for f in dataclass_fields(body_type):
+                    if f.name in data and isinstance(f.type, type) and not isinstance(data[f.name], f.type):
+                        detail = error if error and f.name in fields else (
+                            f"Expected `{f.type.__name__}` for `{f.name}`"
+                        )
+                        return jsonify({"error": detail}), 400
+                data = body_type(**{f.name: data[f.name] for f in dataclass_fields(body_type) if f.name in data})
+            return view(data, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _json_response(body: bytes):
+    return app.response_class(body, mimetype="application/json")
+
+
+# Distinct inputs remembered by the direct analysis endpoints
+ANALYSIS_CACHE_SIZE = 4096
+
+
+def _risk_body(holdings: Any) -> Dict[str, Any]:
+    from tools.risk_assessment import calculate_portfolio_risk
+    result = calculate_portfolio_risk(holdings)
+    return {"success": True, "metrics": result.to_dict(), "summary": result.summary()}
+
+
+def _diversification_body(holdings: Any) -> Dict[str, Any]:
+    from tools.diversification import analyze_diversification
+    result = analyze_diversification(holdings)
+    return {"success": True, "analysis": result.to_dict(), "summary": result.summary()}
+
+
+def _strategy_body(params: Dict[str, Any]) -> Dict[str, Any]:
+    from tools.strategy import design_strategy
+    result = design_strategy(**params)
+    return {"success": True, "strategy": result.to_dict(), "summary": result.summary()}
+
+
+_ANALYSES = {
+    "risk": _risk_body,
+    "diversification": _diversification_body,
+    "strategy": _strategy_body,
+}
+
+
+@functools.lru_cache(maxsize=ANALYSIS_CACHE_SIZE)
+def _analysis_body(name: str, payload: bytes) -> bytes:
+    """
+    Serialized response of an analysis endpoint, memoized on its canonical JSON input.
+    
+    UI polling and repeated tool calls re-post identical portfolios, which
+    then skip both the analytics and the response serialization.
+    """
+    return dumps_bytes(_ANALYSES[name](loads(payload)))
+
+
+def _strategy_params(data: Dict[str, Any]) -> bytes:
+    """Canonical design_strategy() arguments from a request body."""
+    return dumps_bytes({
+        "risk_profile": data.get('risk_profile', 'moderate'),
+        "goals": data.get('goals', []),
+        "current_portfolio_value": float(data.get('current_portfolio_value', 0)),
+        "monthly_contribution": float(data.get('monthly_contribution', 0))
+    }, sort_keys=True)
+
+
+# The health payload never changes while the process runs
+_HEALTH_BODY = dumps_bytes({
+    "status": "healthy",
+    "service": "Wealth Management AI Chatbot",
+    "openai_configured": settings.openai_configured
+})
 
 
 @app.route('/')
@@ -48,15 +303,12 @@ def index():
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint."""
-    return jsonify({
-        "status": "healthy",
-        "service": "Wealth Management AI Chatbot",
-        "openai_configured": bool(settings.openai_api_key and settings.openai_api_key != "your_openai_api_key_here")
-    })
+    return _json_response(_HEALTH_BODY)
 
 
 @app.route('/api/chat', methods=['POST'])
-def chat():
+@require_json("message", error="Message is required", body_type=ChatRequest)
+def chat(data: ChatRequest):
     """
     Process user message through the AI agent.
     
@@ -73,17 +325,13 @@ def chat():
         }
     """
     try:
-        data = request.get_json()
-        
-        if not data or 'message' not in data:
-            return jsonify({"error": "Message is required"}), 400
-        
-        user_message = data['message']
-        user_id = data.get('user_id', 'default')
+        user_message = data.message
+        user_id = data.user_id
         
         # Get agent and process message
         agent = get_agent(user_id)
         response = agent.chat(user_message)
+        _invalidate_memory(user_id)
         
         return jsonify({
             "response": response,
@@ -94,8 +342,39 @@ def chat():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/api/chat/stream', methods=['POST'])
+@require_json("message", error="Message is required", body_type=ChatRequest)
+def chat_stream(data: ChatRequest):
+    """
+    Process user message, streaming the reply as plain text while it is generated.
+    
+    Request body: same as /api/chat.
+    
+    Response: the agent's reply as chunked text/plain; errors before the
+    reply starts are returned as JSON like /api/chat.
+    """
+    try:
+        agent = get_agent(data.user_id)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    
+    def generate():
+        try:
+            yield from agent.stream_chat(data.message)
+        finally:
+            _invalidate_memory(data.user_id)
+    
+    return app.response_class(
+        generate(),
+        mimetype="text/plain",
+        # Ask proxies such as nginx not to buffer the stream
+        headers={"X-Accel-Buffering": "no", "Cache-Control": "no-cache"},
+    )
+
+
 @app.route('/api/risk-assessment', methods=['POST'])
-def risk_assessment():
+@require_json("portfolio", error="Portfolio data is required")
+def risk_assessment(data: Dict[str, Any]):
     """
     Direct portfolio risk assessment endpoint.
     
@@ -108,91 +387,92 @@ def risk_assessment():
         }
     """
     try:
-        data = request.get_json()
-        
-        if not data or 'portfolio' not in data:
-            return jsonify({"error": "Portfolio data is required"}), 400
-        
-        from tools.risk_assessment import calculate_portfolio_risk
-        
-        holdings = data['portfolio']
-        result = calculate_portfolio_risk(holdings)
-        
-        return jsonify({
-            "success": True,
-            "metrics": result.to_dict(),
-            "summary": result.summary()
-        })
+        holdings = dumps_bytes(data['portfolio'], sort_keys=True)
+        return _json_response(_analysis_body("risk", holdings))
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 @app.route('/api/diversification', methods=['POST'])
-def diversification_analysis():
+@require_json("portfolio", error="Portfolio data is required")
+def diversification_analysis(data: Dict[str, Any]):
     """
     Direct diversification analysis endpoint.
     """
     try:
-        data = request.get_json()
-        
-        if not data or 'portfolio' not in data:
-            return jsonify({"error": "Portfolio data is required"}), 400
-        
-        from tools.diversification import analyze_diversification
-        
-        holdings = data['portfolio']
-        result = analyze_diversification(holdings)
-        
-        return jsonify({
-            "success": True,
-            "analysis": result.to_dict(),
-            "summary": result.summary()
-        })
+        holdings = dumps_bytes(data['portfolio'], sort_keys=True)
+        return _json_response(_analysis_body("diversification", holdings))
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 @app.route('/api/strategy', methods=['POST'])
-def investment_strategy():
+@require_json()
+def investment_strategy(data: Dict[str, Any]):
     """
     Direct investment strategy endpoint.
     """
     try:
-        data = request.get_json()
-        
-        from tools.strategy import design_strategy
+        return _json_response(_analysis_body("strategy", _strategy_params(data)))
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/analyze', methods=['POST'])
+@require_json()
+def analyze(data: Dict[str, Any]):
+    """
+    Run several direct analyses in one request.
+    
+    Request body:
+        {
+            "portfolio": [...],               # for risk and diversification
+            "risk_profile": "moderate", ...   # as for /api/strategy
+            "options": {"risk": true, "diversification": true, "strategy": true}
+        }
+    
+    Response:
+        {"success": true, "risk": {...}, "diversification": {...}, "strategy": {...}}
+        with each section shaped like the matching endpoint's response.
+    """
+    try:
+        options = data.get('options') or {}
+        wanted = [name for name in _ANALYSES if options.get(name, True)]
         
-        result = design_strategy(
-            risk_profile=data.get('risk_profile', 'moderate'),
-            goals=data.get('goals', []),
-            current_portfolio_value=float(data.get('current_portfolio_value', 0)),
-            monthly_contribution=float(data.get('monthly_contribution', 0))
-        )
+        holdings = None
+        if "risk" in wanted or "diversification" in wanted:
+            if 'portfolio' not in data:
+                return jsonify({"error": "Portfolio data is required"}), 400
+            holdings = dumps_bytes(data['portfolio'], sort_keys=True)
         
-        return jsonify({
-            "success": True,
-            "strategy": result.to_dict(),
-            "summary": result.summary()
-        })
+        # Splice the memoized section bodies rather than re-serializing them
+        parts = [b'{"success":true']
+        for name in wanted:
+            payload = _strategy_params(data) if name == "strategy" else holdings
+            parts.append(b',"%s":%s' % (name.encode(), _analysis_body(name, payload)))
+        parts.append(b"}")
+        return _json_response(b"".join(parts))
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 @app.route('/api/preferences', methods=['POST'])
-def update_preferences():
+@require_json()
+def update_preferences(data: Dict[str, Any]):
     """
     Update user financial preferences.
     """
     try:
-        data = request.get_json()
         user_id = data.get('user_id', 'default')
         preferences = data.get('preferences', {})
         
         agent = get_agent(user_id)
         agent.update_preferences(preferences)
+        _invalidate_memory(user_id)
         
         return jsonify({
             "success": True,
@@ -204,17 +484,18 @@ def update_preferences():
 
 
 @app.route('/api/portfolio', methods=['POST'])
-def update_portfolio():
+@require_json()
+def update_portfolio(data: Dict[str, Any]):
     """
     Update user's portfolio data.
     """
     try:
-        data = request.get_json()
         user_id = data.get('user_id', 'default')
         portfolio = data.get('portfolio', {})
         
         agent = get_agent(user_id)
         agent.update_portfolio(portfolio)
+        _invalidate_memory(user_id)
         
         return jsonify({
             "success": True,
@@ -232,29 +513,36 @@ def get_memory():
     """
     try:
         user_id = request.args.get('user_id', 'default')
-        agent = get_agent(user_id)
-        summary = agent.get_memory_summary()
+        body = _memory_responses.get(user_id)
+        if body is None:
+            generation = _memory_generation
+            agent = get_agent(user_id)
+            body = dumps_bytes({
+                "success": True,
+                "summary": agent.get_memory_summary()
+            })
+            with _memory_lock:
+                if generation == _memory_generation:
+                    _memory_responses[user_id] = body
         
-        return jsonify({
-            "success": True,
-            "summary": summary
-        })
+        return _json_response(body)
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 @app.route('/api/clear', methods=['POST'])
-def clear_conversation():
+@require_json()
+def clear_conversation(data: Dict[str, Any]):
     """
     Clear conversation history.
     """
     try:
-        data = request.get_json() or {}
         user_id = data.get('user_id', 'default')
         
-        if user_id in agents:
-            agents[user_id].clear_conversation()
+        # Rebuilds an evicted agent so its stored history is cleared too
+        get_agent(user_id).clear_conversation()
+        _invalidate_memory(user_id)
         
         return jsonify({
             "success": True,
@@ -265,16 +553,32 @@ def clear_conversation():
         return jsonify({"error": str(e)}), 500
 
 
+def prewarm_agents():
+    """
+    Pay LLM client, ChromaDB and tool initialization at server start (once
+    per worker process) instead of on the first request.
+    """
+    if settings.agent_prewarm:
+        get_agent("default")
+
+
 if __name__ == '__main__':
     print("\n" + "="*60)
     print("🏦 Wealth Management AI Chatbot")
     print("="*60)
     print(f"📍 Server running at: http://localhost:{settings.flask_port}")
-    print(f"🤖 OpenAI configured: {bool(settings.openai_api_key and settings.openai_api_key != 'your_openai_api_key_here')}")
+    print(f"🤖 OpenAI configured: {settings.openai_configured}")
     print("="*60 + "\n")
     
+    # Under the reloader this process only watches files; the child serves
+    if not settings.flask_debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        prewarm_agents()
+    
+    # Worker threads only wait on the shared agent event loop, so
+    # concurrent requests overlap their LLM round-trips
     app.run(
         host=settings.flask_host,
         port=settings.flask_port,
-        debug=settings.flask_debug
+        debug=settings.flask_debug,
+        threaded=True
     )
@@ -1,15 +1,15 @@
 """Configuration settings for Wealth Management AI Chatbot."""
 import os
 from dataclasses import dataclass, field
-from typing import Optional
+from typing import List, Optional
 from dotenv import load_dotenv
 
 load_dotenv()
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Settings:
-    """Application configuration settings."""
+    """Application configuration settings (read-only once loaded)."""
     
     # LLM Settings
     openai_api_key: str = field(default_factory=lambda: os.getenv("OPENAI_API_KEY", ""))
@@ -19,14 +19,24 @@ class Settings:
     openrouter_model: str = field(default_factory=lambda: os.getenv("OPENROUTER_MODEL", "nex-agi/deepseek-v3.1-nex-n1:free"))
     openai_model: str = "gpt-4"
     temperature: float = 0.7
-    
+    llm_concurrency: int = 8  # Max in-flight LLM calls per event loop
+    batch_concurrency: int = 5  # Max concurrent users per run_batch call
+    max_agent_iterations: int = 3  # LLM round-trips per LangChain agent turn
+    debug: bool = False  # Verbose agent tracing to stdout
+    llm_warmup: bool = True  # Send a 1-token request at client start to open the connection
+
     # ChromaDB Settings
     chroma_persist_dir: str = "./chroma_db"
+    chroma_http_url: Optional[str] = field(default_factory=lambda: os.getenv("CHROMA_HTTP_URL"))  # e.g. http://localhost:8000
+    chroma_embedding_model: str = "BAAI/bge-small-en-v1.5"  # sentence-transformers model; 384-dim
     
     # Flask Settings
     flask_host: str = "0.0.0.0"
     flask_port: int = 5000
-    flask_debug: bool = True
+    flask_debug: bool = field(default_factory=lambda: os.getenv("FLASK_DEBUG", "").lower() in ("1", "true"))  # Opt-in: the debugger runs arbitrary code
+    agent_prewarm: bool = True  # Build the "default" agent at server start so the first request skips cold init
+    cors_origins: List[str] = field(default_factory=lambda: os.getenv("CORS_ORIGINS", "*").split(","))  # Allowed for /api/*
+    agent_cache_max: int = field(default_factory=lambda: int(os.getenv("AGENT_CACHE_MAX", "1024")))  # Agents kept in memory
     
     # MS Fabric Settings (optional)
     azure_tenant_id: Optional[str] = field(default_factory=lambda: os.getenv("AZURE_TENANT_ID"))
@@ -39,6 +49,15 @@ class Settings:
     trading_days_per_year: int = 252
     confidence_level: float = 0.95  # 95% VaR
     
+    # Derived once at load
+    openai_configured: bool = field(init=False)
+    
+    def __post_init__(self):
+        object.__setattr__(
+            self, "openai_configured",
+            bool(self.openai_api_key and self.openai_api_key != "your_openai_api_key_here")
+        )
+    
     def validate(self) -> bool:
         """Validate required settings."""
         if self.primary_model == "openai" and not self.openai_api_key:
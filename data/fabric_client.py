@@ -1,7 +1,17 @@
 """Microsoft Fabric OneLake data client."""
+import io
 import os
-from typing import Optional, Dict, Any, List
-import json
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Iterable, List, Tuple
+
+from utils.fast_json import dumps_bytes, loads
+
+logger = logging.getLogger(__name__)
+
+# Concurrent uploads in save_many(); the HTTP connection pool is sized to match
+UPLOAD_WORKERS = 16
 
 
 class FabricClient:
@@ -39,16 +49,25 @@ class FabricClient:
     def _init_client(self):
         """Initialize Azure Data Lake client."""
         try:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from azure.core.pipeline.transport import RequestsTransport
             from azure.identity import DefaultAzureCredential
             from azure.storage.filedatalake import DataLakeServiceClient
             
             # OneLake endpoint
             account_url = f"https://onelake.dfs.fabric.microsoft.com"
             
+            # Keep one pooled connection per upload worker so concurrent
+            # writes reuse TLS sessions instead of reconnecting
+            session = requests.Session()
+            session.mount("https://", HTTPAdapter(pool_maxsize=UPLOAD_WORKERS))
+            
             credential = DefaultAzureCredential()
             self._client = DataLakeServiceClient(
                 account_url=account_url,
-                credential=credential
+                credential=credential,
+                transport=RequestsTransport(session=session)
             )
             
             # Get file system (Lakehouse)
@@ -57,10 +76,10 @@ class FabricClient:
             )
             
         except ImportError:
-            print("Azure packages not installed. Install with: pip install azure-identity azure-storage-file-datalake")
+            logger.warning("Azure packages not installed. Install with: pip install azure-identity azure-storage-file-datalake")
             self.is_configured = False
         except Exception as e:
-            print(f"Failed to initialize Fabric client: {e}")
+            logger.error("Failed to initialize Fabric client: %s", e)
             self.is_configured = False
     
     def read_json(self, path: str) -> Optional[Dict[str, Any]]:
@@ -78,11 +97,12 @@ class FabricClient:
         
         try:
             file_client = self._file_system.get_file_client(path)
-            download = file_client.download_file()
-            content = download.readall().decode('utf-8')
-            return json.loads(content)
+            # Parse the downloaded buffer in place rather than copying it out
+            buffer = io.BytesIO()
+            file_client.download_file().readinto(buffer)
+            return loads(buffer.getbuffer())
         except Exception as e:
-            print(f"Error reading from Fabric: {e}")
+            logger.error("Error reading %s from Fabric: %s", path, e)
             return None
     
     def write_json(self, path: str, data: Dict[str, Any]) -> bool:
@@ -100,14 +120,49 @@ class FabricClient:
             return False
         
         try:
-            file_client = self._file_system.get_file_client(path)
-            content = json.dumps(data, indent=2).encode('utf-8')
-            file_client.upload_data(content, overwrite=True)
+            self._upload(path, data)
             return True
         except Exception as e:
-            print(f"Error writing to Fabric: {e}")
+            logger.error("Error writing %s to Fabric: %s", path, e)
             return False
     
+    def _upload(self, path: str, data: Dict[str, Any]):
+        file_client = self._file_system.get_file_client(path)
+        file_client.upload_data(dumps_bytes(data), overwrite=True)
+    
+    def save_many(
+        self, items: Iterable[Tuple[str, Dict[str, Any]]], max_workers: int = UPLOAD_WORKERS
+    ) -> List[bool]:
+        """
+        Write many JSON files to OneLake concurrently.
+        
+        Args:
+            items: (path, data) pairs
+            max_workers: Maximum uploads in flight
+        
+        Returns:
+            Success status per item, in input order
+        """
+        items = list(items)
+        if not self.is_configured or not self._file_system:
+            return [False] * len(items)
+        
+        def upload(item: Tuple[str, Dict[str, Any]]) -> bool:
+            try:
+                self._upload(*item)
+                return True
+            except Exception as e:
+                logger.debug("Error writing %s to Fabric: %s", item[0], e)
+                return False
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(upload, items))
+        
+        failed = results.count(False)
+        if failed:
+            logger.warning("%d of %d Fabric writes failed", failed, len(items))
+        return results
+    
     def list_files(self, directory: str = "Files") -> List[str]:
         """
         List files in a directory.
@@ -125,7 +180,7 @@ class FabricClient:
             paths = self._file_system.get_paths(path=directory)
             return [p.name for p in paths]
         except Exception as e:
-            print(f"Error listing files: {e}")
+            logger.error("Error listing files in %s: %s", directory, e)
             return []
     
     def save_portfolio(self, user_id: str, portfolio: Dict[str, Any]) -> bool:
@@ -160,8 +215,8 @@ class LocalStorageClient:
     def save_portfolio(self, user_id: str, portfolio: Dict[str, Any]) -> bool:
         path = os.path.join(self.storage_dir, f"portfolio_{user_id}.json")
         try:
-            with open(path, 'w') as f:
-                json.dump(portfolio, f, indent=2)
+            with open(path, 'wb') as f:
+                f.write(dumps_bytes(portfolio))
             return True
         except Exception:
             return False
@@ -169,14 +224,20 @@ class LocalStorageClient:
     def load_portfolio(self, user_id: str) -> Optional[Dict[str, Any]]:
         path = os.path.join(self.storage_dir, f"portfolio_{user_id}.json")
         try:
-            with open(path, 'r') as f:
-                return json.load(f)
+            with open(path, 'rb') as f:
+                return loads(f.read())
         except Exception:
             return None
 
 
+@functools.cache
 def get_storage_client():
-    """Get appropriate storage client based on configuration."""
+    """
+    Get the process-wide storage client for the configuration, creating it once.
+    
+    Sharing one FabricClient means the Azure credential chain is walked and
+    its tokens cached once, rather than for every caller.
+    """
     fabric = FabricClient()
     if fabric.is_configured:
         return fabric
@@ -1,10 +1,12 @@
 """Data models for wealth management."""
-from dataclasses import dataclass, field
-from typing import List, Optional, Dict, Any
+from dataclasses import InitVar, dataclass, field
+from typing import List, Optional, Dict, Any, Union
+import sys
+import time
 from datetime import datetime
 
 
-@dataclass
+@dataclass(slots=True)
 class Holding:
     """Individual investment holding."""
     symbol: str
@@ -32,39 +34,114 @@ class Holding:
     
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "Holding":
-        return cls(**{k: v for k, v in data.items() if k in cls.__dataclass_fields__})
+        # Positional construction; unknown keys are ignored, optional ones default to None
+        holding = cls(
+            *[data[k] for k in _HOLDING_REQUIRED],
+            *[data.get(k) for k in _HOLDING_OPTIONAL]
+        )
+        # Parsed labels are fresh strings; stored portfolios share one copy of each
+        holding.asset_class = _label(holding.asset_class)
+        holding.sector = _label(holding.sector)
+        holding.geography = _label(holding.geography)
+        return holding
 
 
-@dataclass
+# Common category labels, interned so every stored holding points at the same string
+_LABELS = {
+    label: sys.intern(label)
+    for label in (
+        "equity", "bond", "cash", "real_estate", "commodity", "crypto", "unknown",
+        "technology", "healthcare", "financials", "energy", "industrials",
+        "consumer_staples", "consumer_discretionary", "utilities", "materials",
+        "diversified", "bonds", "reit", "gold",
+        "US", "International", "Global", "Europe", "Asia", "Emerging Markets",
+    )
+}
+
+
+def _label(value: Any) -> Any:
+    """Canonical copy of a known category label; anything else passes through."""
+    return _LABELS.get(value, value) if isinstance(value, str) else value
+
+
+def _now_us() -> int:
+    """Current time in epoch microseconds (isoformat's resolution)."""
+    return time.time_ns() // 1000
+
+
+_HOLDING_REQUIRED = ("symbol", "name", "value", "asset_class")
+_HOLDING_OPTIONAL = tuple(f for f in Holding.__dataclass_fields__ if f not in _HOLDING_REQUIRED)
+
+
+@dataclass(slots=True)
 class Portfolio:
-    """User's investment portfolio."""
+    """
+    User's investment portfolio.
+    
+    Totals are maintained as holdings are added and removed, so reading
+    total_value or asset_allocation does not rescan the holdings; change
+    holdings through add_holding()/remove_holding() to keep them in step.
+    
+    Serialize with to_dict(): dataclasses.asdict() would return the
+    private cache fields and leave out updated_at, which is not a field.
+    """
     user_id: str
     holdings: List[Holding] = field(default_factory=list)
     created_at: str = field(default_factory=lambda: datetime.now().isoformat())
-    updated_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    updated_at: InitVar[Optional[str]] = None  # Read and assigned through the property below
+    # The timestamp given, as-is, or epoch microseconds stamped by the last
+    # change and formatted only when read
+    _updated_at: Union[str, int] = field(default=0, init=False, repr=False)
+    _total_value: float = field(default=0.0, init=False, repr=False, compare=False)
+    _class_totals: Dict[str, float] = field(default_factory=dict, init=False, repr=False, compare=False)
+    
+    def __post_init__(self, updated_at: Optional[str]):
+        self._updated_at = updated_at if updated_at is not None else _now_us()
+        
+        # Bulk loads (from_dict, aggregate views) sum all holdings in one pass
+        for h in self.holdings:
+            self._add_to_totals(h)
+    
+    def _add_to_totals(self, holding: Holding, sign: int = 1):
+        self._total_value += sign * holding.value
+        self._class_totals[holding.asset_class] = (
+            self._class_totals.get(holding.asset_class, 0) + sign * holding.value
+        )
     
     @property
     def total_value(self) -> float:
-        return sum(h.value for h in self.holdings)
+        return self._total_value
     
     @property
     def asset_allocation(self) -> Dict[str, float]:
-        if not self.holdings or self.total_value == 0:
+        total = self._total_value
+        if not self.holdings or total == 0:
             return {}
         
-        allocation = {}
-        for h in self.holdings:
-            allocation[h.asset_class] = allocation.get(h.asset_class, 0) + h.value
-        
-        return {k: v / self.total_value for k, v in allocation.items()}
+        return {k: v / total for k, v in self._class_totals.items()}
     
     def add_holding(self, holding: Holding):
         self.holdings.append(holding)
-        self.updated_at = datetime.now().isoformat()
+        self._add_to_totals(holding)
+        self._updated_at = _now_us()
     
     def remove_holding(self, symbol: str):
-        self.holdings = [h for h in self.holdings if h.symbol != symbol]
-        self.updated_at = datetime.now().isoformat()
+        kept = []
+        removed_classes = set()
+        for h in self.holdings:
+            if h.symbol == symbol:
+                self._add_to_totals(h, sign=-1)
+                removed_classes.add(h.asset_class)
+            else:
+                kept.append(h)
+        self.holdings = kept
+        
+        # Drop classes left without holdings rather than keep a float residue
+        for asset_class in removed_classes - {h.asset_class for h in kept}:
+            del self._class_totals[asset_class]
+        if not kept:
+            self._total_value = 0.0
+        self._updated_at = _now_us()
     
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -83,10 +160,28 @@ class Portfolio:
             user_id=data["user_id"],
             holdings=holdings,
             created_at=data.get("created_at", datetime.now().isoformat()),
-            updated_at=data.get("updated_at", datetime.now().isoformat()),
+            updated_at=data.get("updated_at"),
         )
 
 
+def _get_updated_at(self: Portfolio) -> str:
+    """Last change as an ISO 8601 string (local time when stamped by a change)."""
+    stamp = self._updated_at
+    if isinstance(stamp, str):
+        return stamp
+    seconds, micros = divmod(stamp, 1_000_000)
+    return datetime.fromtimestamp(seconds).replace(microsecond=micros).isoformat()
+
+
+def _set_updated_at(self: Portfolio, value: str):
+    self._updated_at = value
+
+
+# Set after the class is built: a property in the class body would be taken
+# as the default of the updated_at constructor argument
+Portfolio.updated_at = property(_get_updated_at, _set_updated_at)
+
+
 @dataclass
 class UserPreferences:
     """User's financial preferences and profile."""
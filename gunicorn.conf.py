@@ -0,0 +1,14 @@
+"""gunicorn settings picked up from the working directory."""
+
+# One process: the embedded ChromaDB store is not safe to share between
+# processes, and agents, cached preferences and /api/memory bodies live in
+# process memory. Request threads overlap on the shared agent event loop.
+worker_class = "gthread"
+workers = 1
+threads = 64
+
+
+def post_worker_init(worker):
+    """Build the default agent before the worker accepts requests."""
+    from api.app import prewarm_agents
+    prewarm_agents()
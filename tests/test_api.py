@@ -0,0 +1,44 @@
+"""Tests for the Flask API."""
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.app import app
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+class TestChatValidation:
+    """Tests for /api/chat request validation."""
+    
+    def test_missing_message(self, client):
+        """Test that a body without a message is rejected."""
+        response = client.post("/api/chat", json={"user_id": "test"})
+        
+        assert response.status_code == 400
+        assert response.get_json()["error"] == "Message is required"
+    
+    def test_message_wrong_type(self, client):
+        """Test that a non-string message is rejected, not a server error."""
+        response = client.post("/api/chat", json={"message": 5})
+        
+        assert response.status_code == 400
+        assert response.get_json()["error"] == "Message is required"
+    
+    def test_user_id_wrong_type(self, client):
+        """Test that a bad user_id gets its own error rather than the message one."""
+        response = client.post("/api/chat", json={"message": "hi", "user_id": 5})
+        
+        assert response.status_code == 400
+        assert "user_id" in response.get_json()["error"]
+    
+    def test_invalid_json(self, client):
+        """Test that a malformed body is rejected."""
+        response = client.post("/api/chat", data="{not json", content_type="application/json")
+        
+        assert response.status_code == 400
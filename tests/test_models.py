@@ -0,0 +1,93 @@
+"""Tests for wealth management data models."""
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data.models import Holding, Portfolio
+
+
+def make_holding(symbol, value, asset_class):
+    return Holding(symbol=symbol, name=symbol, value=value, asset_class=asset_class)
+
+
+class TestPortfolio:
+    """Tests for Portfolio totals and serialization."""
+    
+    def test_totals_from_constructor(self):
+        """Test that holdings passed at construction are summed."""
+        portfolio = Portfolio("u1", [
+            make_holding("VTI", 60000, "equity"),
+            make_holding("VXUS", 20000, "equity"),
+            make_holding("BND", 20000, "bond"),
+        ])
+        
+        assert portfolio.total_value == 100000
+        assert portfolio.asset_allocation == pytest.approx({"equity": 0.8, "bond": 0.2})
+    
+    def test_empty_portfolio(self):
+        """Test that an empty portfolio has no value or allocation."""
+        portfolio = Portfolio("u1")
+        
+        assert portfolio.total_value == 0
+        assert portfolio.asset_allocation == {}
+    
+    def test_add_and_remove_holdings(self):
+        """Test that totals follow holdings as they are added and removed."""
+        portfolio = Portfolio("u1")
+        portfolio.add_holding(make_holding("VTI", 30000, "equity"))
+        portfolio.add_holding(make_holding("BND", 10000, "bond"))
+        
+        assert portfolio.total_value == 40000
+        assert portfolio.asset_allocation == pytest.approx({"equity": 0.75, "bond": 0.25})
+        
+        portfolio.remove_holding("BND")
+        
+        assert portfolio.total_value == 30000
+        assert portfolio.asset_allocation == {"equity": 1.0}  # Emptied class is dropped
+        
+        portfolio.remove_holding("VTI")
+        
+        assert portfolio.total_value == 0
+        assert portfolio.asset_allocation == {}
+    
+    def test_remove_missing_symbol(self):
+        """Test that removing an unknown symbol leaves totals unchanged."""
+        portfolio = Portfolio("u1", [make_holding("VTI", 30000, "equity")])
+        
+        portfolio.remove_holding("AAPL")
+        
+        assert portfolio.total_value == 30000
+        assert len(portfolio.holdings) == 1
+    
+    def test_dict_round_trip(self):
+        """Test that to_dict/from_dict preserve holdings, totals and timestamps."""
+        portfolio = Portfolio("u1", [
+            make_holding("VTI", 30000, "equity"),
+            make_holding("BND", 10000, "bond"),
+        ])
+        data = portfolio.to_dict()
+        
+        restored = Portfolio.from_dict(data)
+        
+        assert restored.to_dict() == data
+        assert restored.total_value == 40000
+        assert restored.updated_at == portfolio.updated_at
+        assert [h.symbol for h in restored.holdings] == ["VTI", "BND"]
+    
+    def test_updated_at(self):
+        """Test that updated_at can be given, assigned, and is restamped by changes."""
+        portfolio = Portfolio("u1", updated_at="2024-01-01T00:00:00")
+        
+        assert portfolio.updated_at == "2024-01-01T00:00:00"
+        
+        portfolio.updated_at = "2024-06-01T00:00:00"
+        assert portfolio.updated_at == "2024-06-01T00:00:00"
+        
+        portfolio.add_holding(make_holding("VTI", 1000, "equity"))
+        assert portfolio.updated_at > "2024-06-01T00:00:00"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
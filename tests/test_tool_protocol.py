@@ -0,0 +1,103 @@
+"""Tests for the TOOL:/INPUT: tool call protocol."""
+import pytest
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai.tool_protocol import _expand_batch, execute_tool_calls, parse_tool_calls
+
+
+class TestParseToolCalls:
+    """Tests for extracting tool calls from model output."""
+    
+    def test_no_tool_call(self):
+        """Test that plain text has no calls."""
+        assert parse_tool_calls("Your portfolio looks balanced.") == []
+    
+    def test_multiple_calls(self):
+        """Test that every TOOL/INPUT pair is returned in order."""
+        text = (
+            "Let me check.\n"
+            "TOOL: assess_risk\n"
+            'INPUT: {"portfolio": [1, 2]}\n'
+            "TOOL: design_strategy\n"
+            'INPUT: {"risk_profile": "moderate"}\n'
+        )
+        
+        calls = parse_tool_calls(text)
+        
+        assert calls == [
+            ("assess_risk", '{"portfolio": [1, 2]}'),
+            ("design_strategy", '{"risk_profile": "moderate"}'),
+        ]
+    
+    def test_batch_call(self):
+        """Test that the batch pseudo-tool expands into its calls."""
+        text = (
+            "TOOL: batch\n"
+            'INPUT: {"batch": [{"tool": "assess_risk", "input": {"a": 1}}, '
+            '{"tool": "analyze_diversification", "input": "[]"}]}\n'
+        )
+        
+        calls = parse_tool_calls(text)
+        
+        assert [name for name, _ in calls] == ["assess_risk", "analyze_diversification"]
+        assert json.loads(calls[0][1]) == {"a": 1}
+        assert calls[1][1] == "[]"  # String inputs are passed as-is
+    
+    def test_multiline_json_input(self):
+        """Test that JSON spanning several lines is sliced at its exact end."""
+        payload = {"goals": [{"target_amount": 100000, "years": 10}], "risk_profile": "moderate"}
+        text = (
+            "TOOL: design_strategy\n"
+            f"INPUT: {json.dumps(payload, indent=2)}\n"
+            "I will summarize once the tool returns.\n"
+        )
+        
+        calls = parse_tool_calls(text)
+        
+        assert len(calls) == 1
+        name, tool_input = calls[0]
+        assert name == "design_strategy"
+        assert json.loads(tool_input) == payload
+    
+    def test_non_json_input_passed_through(self):
+        """Test that a non-JSON input reaches the tool unchanged."""
+        text = "TOOL: assess_risk\nINPUT: aggressive, 30 years\n"
+        
+        assert parse_tool_calls(text) == [("assess_risk", "aggressive, 30 years")]
+    
+    def test_unknown_tool(self):
+        """Test that unknown tool names are parsed and left to the caller to filter."""
+        tools = {"assess_risk": lambda tool_input: "risk"}
+        text = (
+            'TOOL: made_up_tool\nINPUT: {"x": 1}\n'
+            'TOOL: assess_risk\nINPUT: {}\n'
+        )
+        
+        calls = parse_tool_calls(text)
+        
+        assert [name for name, _ in calls] == ["made_up_tool", "assess_risk"]
+        assert [(name, inp) for name, inp in calls if name in tools] == [("assess_risk", "{}")]
+        assert execute_tool_calls(calls[:1], tools)[0].startswith("Tool error")
+
+
+class TestExpandBatch:
+    """Tests for decoding batch payloads."""
+    
+    def test_skips_malformed_entries(self):
+        """Test that entries without a tool name are dropped."""
+        text = '{"batch": [{"input": {}}, "assess_risk", {"tool": "assess_risk"}]}'
+        
+        assert _expand_batch(text, 0) == [("assess_risk", "{}")]
+    
+    def test_invalid_payload(self):
+        """Test that a payload that is not a JSON object yields no calls."""
+        assert _expand_batch("not json", 0) == []
+        assert _expand_batch("[1, 2]", 0) == []
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -14,10 +14,11 @@ from tools.risk_assessment import (
 )
 from tools.diversification import (
     analyze_diversification,
+    analyze_diversification_batch,
     suggest_rebalancing,
     analyze_diversification_tool,
 )
-from tools.strategy import design_strategy, design_strategy_tool
+from tools.strategy import design_strategy, design_strategy_batch, design_strategy_tool
 
 
 class TestRiskAssessment:
@@ -74,6 +75,54 @@ class TestRiskAssessment:
         assert result.risk_level in [RiskLevel.AGGRESSIVE, RiskLevel.VERY_AGGRESSIVE]
         assert result.recommended_equity_allocation >= 0.70
     
+    def test_assess_risk_tolerance_band_boundaries(self):
+        """Test that a score on a band threshold falls in the upper band."""
+        base = {"age": 45, "time_horizon": 7}  # neither adjusts the score of 50
+        cases = [
+            # experience, loss reaction, goal -> score, level
+            ("intermediate", "sell_some", "preservation", 25, RiskLevel.MODERATE),
+            ("intermediate", "hold", "income", 50, RiskLevel.AGGRESSIVE),
+            ("advanced", "buy_more", "income", 75, RiskLevel.VERY_AGGRESSIVE),
+        ]
+        
+        for experience, reaction, goal, score, level in cases:
+            result = assess_risk_tolerance({
+                **base,
+                "investment_experience": experience,
+                "loss_reaction": reaction,
+                "goal": goal,
+            })
+            assert result.score == score
+            assert result.risk_level == level
+    
+    def test_assess_risk_tolerance_fractional_inputs(self):
+        """Test that non-integer age and horizon score like the original thresholds."""
+        base = {"investment_experience": "intermediate", "loss_reaction": "hold", "goal": "income"}
+        cases = [
+            # age, time horizon -> score (50 before age/horizon adjustments)
+            (55.0, 7, 50),
+            (55.5, 7, 35),
+            (29.5, 7, 70),
+            (45, 4.5, 30),
+            (45, 10.0, 50),
+            (45, 10.5, 55),
+            (45, 20.0, 55),
+            (45, 20.5, 65),
+        ]
+        
+        for age, years, score in cases:
+            result = assess_risk_tolerance({**base, "age": age, "time_horizon": years})
+            assert result.score == score
+    
+    def test_assess_risk_tolerance_retirement_age(self):
+        """Test that ages over 65 lower the score more than ages over 55."""
+        base = {"time_horizon": 7, "investment_experience": "intermediate", "loss_reaction": "hold", "goal": "income"}
+        
+        assert assess_risk_tolerance({**base, "age": 60}).score == 35
+        assert assess_risk_tolerance({**base, "age": 65}).score == 35
+        assert assess_risk_tolerance({**base, "age": 65.5}).score == 25
+        assert assess_risk_tolerance({**base, "age": 70}).score == 25
+    
     def test_risk_tool_function(self):
         """Test the LangChain tool function."""
         portfolio_json = json.dumps([
@@ -117,6 +166,30 @@ class TestDiversification:
         assert result.asset_class_score < 30  # Low diversification
         assert "HIGH" in result.concentration_risk or "MODERATE" in result.concentration_risk
     
+    def test_analyze_diversification_batch_matches_single(self):
+        """Test that batch analysis agrees with per-portfolio analysis."""
+        portfolios = [
+            [
+                {"symbol": "AAPL", "value": 80000, "asset_class": "equity", "sector": "technology", "geography": "US"},
+                {"symbol": "BND", "value": 20000, "asset_class": "bond", "sector": "bonds", "geography": "US"},
+            ],
+            [],
+            [{"symbol": "GLD", "value": 5000, "asset_class": "commodity"}],
+            [{"symbol": "CASH", "value": 0, "asset_class": "cash"}],
+        ]
+        
+        results = analyze_diversification_batch(portfolios)
+        
+        assert len(results) == len(portfolios)
+        for holdings, result in zip(portfolios, results):
+            expected = analyze_diversification(holdings)
+            assert result.overall_score == pytest.approx(expected.overall_score)
+            assert result.concentration_risk == expected.concentration_risk
+            assert result.recommendations == expected.recommendations
+            assert result.breakdown.keys() == expected.breakdown.keys()
+            for category, allocations in expected.breakdown.items():
+                assert result.breakdown[category] == pytest.approx(allocations)
+    
     def test_suggest_rebalancing(self):
         """Test rebalancing suggestions."""
         # Portfolio heavy in equity
@@ -163,6 +236,26 @@ class TestStrategy:
         assert result.strategy_name == "Capital Preservation"
         assert result.recommended_allocation.get("bond", 0) >= 0.4
     
+    def test_design_strategy_batch_matches_single(self):
+        """Test that batch scenarios agree with single-goal design_strategy."""
+        scenarios = [
+            ("moderate", 1000000, 25, 50000, 1000),
+            ("conservative", 500000, 3, 0, 0),
+            ("very aggressive", 2000000, 40, 10000, 500),
+        ]
+        
+        monthly_needed, projected = design_strategy_batch(*map(list, zip(*scenarios)))
+        
+        for i, (risk_profile, target, years, current, monthly) in enumerate(scenarios):
+            plan = design_strategy(
+                risk_profile=risk_profile,
+                goals=[{"target_amount": target, "years": years}],
+                current_portfolio_value=current,
+                monthly_contribution=monthly,
+            )
+            assert monthly_needed[i] == pytest.approx(plan.monthly_savings_needed)
+            assert projected[i] == pytest.approx(plan.projected_value)
+    
     def test_strategy_tool_function(self):
         """Test the LangChain tool function."""
         request_json = json.dumps({
@@ -7,11 +7,13 @@ from .risk_assessment import (
 )
 from .diversification import (
     analyze_diversification,
+    analyze_diversification_batch,
     suggest_rebalancing,
     DiversificationScore,
 )
 from .strategy import (
     design_strategy,
+    design_strategy_batch,
     InvestmentPlan,
 )
 
@@ -21,8 +23,10 @@ __all__ = [
     "RiskMetrics",
     "RiskProfile",
     "analyze_diversification",
+    "analyze_diversification_batch",
     "suggest_rebalancing",
     "DiversificationScore",
     "design_strategy",
+    "design_strategy_batch",
     "InvestmentPlan",
 ]
@@ -1,11 +1,16 @@
 """Asset diversification analysis tools."""
 from dataclasses import dataclass
-from typing import List, Dict, Any, Optional
-from collections import defaultdict
-import json
+from heapq import nlargest
+from operator import itemgetter
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Tuple
 
+from utils.fast_json import loads
 
-@dataclass
+if TYPE_CHECKING:
+    import numpy as np
+
+
+@dataclass(slots=True)
 class DiversificationScore:
     """Diversification analysis results."""
     overall_score: float  # 0-100
@@ -31,14 +36,17 @@ class DiversificationScore:
         """Generate human-readable summary."""
         score_emoji = "🟢" if self.overall_score >= 70 else "🟡" if self.overall_score >= 40 else "🔴"
         
-        recommendations_text = "\n".join([f"• {r}" for r in self.recommendations[:5]])
+        recommendations_text = "\n".join(f"• {r}" for r in self.recommendations[:5])
         
         # Format breakdown
-        breakdown_text = ""
+        parts = []
         for category, allocations in self.breakdown.items():
-            breakdown_text += f"\n**{category.title()}**:\n"
-            for item, pct in sorted(allocations.items(), key=lambda x: -x[1])[:5]:
-                breakdown_text += f"  - {item}: {pct:.1f}%\n"
+            parts.append(f"\n**{category.title()}**:\n")
+            parts.extend(
+                f"  - {item}: {pct:.1f}%\n"
+                for item, pct in nlargest(5, allocations.items(), key=itemgetter(1))
+            )
+        breakdown_text = "".join(parts)
         
         return f"""
 {score_emoji} **Diversification Analysis**
@@ -60,7 +68,7 @@ class DiversificationScore:
 """
 
 
-@dataclass 
+@dataclass(frozen=True, slots=True)
 class Trade:
     """Recommended trade for rebalancing."""
     action: str  # buy, sell
@@ -70,6 +78,58 @@ class Trade:
     reason: str
 
 
+# Recommendation rules, in output order:
+# (allocation, key, fires above this %, fires below this many categories, message)
+_RECOMMENDATION_RULES = (
+    ("asset_class", None, None, 3, "Consider adding more asset classes (bonds, real estate, commodities)"),
+    ("asset_class", "equity", 80, 0, "High equity allocation - consider adding bonds for stability"),
+    ("asset_class", "cash", 30, 0, "High cash position - consider deploying to growth assets"),
+    ("geography", "unknown", 50, 2, "Add international exposure for geographic diversification"),
+    ("holding", "largest", 20, 0, "Consider reducing largest positions to below 20% each"),
+    ("sector", "technology", 40, 0, "Heavy tech concentration - diversify into other sectors"),
+)
+
+
+def _group_sum(keys: List[Any], weights: "np.ndarray") -> Dict[Any, float]:
+    """Sum weights per distinct key, keeping keys in first-seen order."""
+    import numpy as np
+    
+    codes: Dict[Any, int] = {}
+    idx = np.fromiter(
+        (codes.setdefault(k, len(codes)) for k in keys), dtype=np.intp, count=len(keys)
+    )
+    sums = np.bincount(idx, weights=weights, minlength=len(codes))
+    return dict(zip(codes, sums.tolist()))
+
+
+def _holding_values(holdings: List[Dict[str, Any]]) -> "np.ndarray":
+    """Holding values as a float array, in holdings order."""
+    import numpy as np
+    
+    return np.fromiter(
+        (float(h.get("value", 0)) for h in holdings), dtype=np.float64, count=len(holdings)
+    )
+
+
+def calculate_diversity_score(allocations: Dict[Any, float]) -> float:
+    """
+    Normalized Shannon entropy of an allocation, 0-100 (higher = more diversified).
+    
+    S = -sum(p ln p) over the category weights p; dividing by ln(n) maps an
+    even split across n categories to 100. e^S is the "effective number"
+    of equally weighted categories.
+    """
+    import numpy as np
+    
+    p = np.fromiter(allocations.values(), dtype=np.float64, count=len(allocations))
+    if p.size <= 1:
+        return 0.0
+    p = p / p.sum()
+    nonzero = p[p > 0]  # 0 * ln 0 is taken as 0
+    entropy = -float(np.dot(nonzero, np.log(nonzero)))
+    return min(100.0, 100.0 * entropy / np.log(p.size))
+
+
 def analyze_diversification(holdings: List[Dict[str, Any]]) -> DiversificationScore:
     """
     Assess portfolio diversification across sectors, geography, and asset classes.
@@ -90,7 +150,8 @@ def analyze_diversification(holdings: List[Dict[str, Any]]) -> DiversificationSc
             breakdown={}
         )
     
-    total_value = sum(float(h.get("value", 0)) for h in holdings)
+    values = _holding_values(holdings)
+    total_value = float(values.sum())
     if total_value == 0:
         return DiversificationScore(
             overall_score=0, sector_score=0, geography_score=0,
@@ -99,55 +160,46 @@ def analyze_diversification(holdings: List[Dict[str, Any]]) -> DiversificationSc
             breakdown={}
         )
     
-    # Calculate allocations
-    asset_class_alloc = defaultdict(float)
-    sector_alloc = defaultdict(float)
-    geography_alloc = defaultdict(float)
-    
-    for h in holdings:
-        weight = float(h.get("value", 0)) / total_value * 100
-        
-        asset_class = h.get("asset_class", "unknown")
-        asset_class_alloc[asset_class] += weight
-        
-        sector = h.get("sector", "unknown")
-        sector_alloc[sector] += weight
-        
-        geography = h.get("geography", "unknown")
-        geography_alloc[geography] += weight
-    
-    # Score calculations (using entropy-like measure)
-    def calculate_diversity_score(allocations: Dict[str, float]) -> float:
-        """Higher score = more diversified."""
-        if len(allocations) <= 1:
-            return 0
-        
-        values = list(allocations.values())
-        max_weight = max(values)
-        num_categories = len(values)
-        
-        # Penalize heavy concentration
-        concentration_penalty = max(0, (max_weight - 40) * 1.5)
-        
-        # Bonus for more categories
-        category_bonus = min(num_categories * 10, 30)
-        
-        # Base score from evenness
-        ideal_weight = 100 / num_categories
-        deviation = sum(abs(v - ideal_weight) for v in values) / num_categories
-        evenness_score = max(0, 50 - deviation)
+    if len(holdings) == 1:
+        # A single position is one 100% bucket in every category and scores 0
+        h = holdings[0]
+        asset_class_alloc = {h.get("asset_class", "unknown"): 100.0}
+        sector_alloc = {h.get("sector", "unknown"): 100.0}
+        geography_alloc = {h.get("geography", "unknown"): 100.0}
+        asset_class_score = sector_score = geography_score = 0.0
+        max_holding_weight = 100.0
+    else:
+        # Calculate allocations (percent of total value per category)
+        weights = values / total_value * 100
+        asset_class_alloc = _group_sum([h.get("asset_class", "unknown") for h in holdings], weights)
+        sector_alloc = _group_sum([h.get("sector", "unknown") for h in holdings], weights)
+        geography_alloc = _group_sum([h.get("geography", "unknown") for h in holdings], weights)
         
-        return min(100, max(0, evenness_score + category_bonus - concentration_penalty))
-    
-    asset_class_score = calculate_diversity_score(dict(asset_class_alloc))
-    sector_score = calculate_diversity_score(dict(sector_alloc))
-    geography_score = calculate_diversity_score(dict(geography_alloc))
+        asset_class_score = calculate_diversity_score(asset_class_alloc)
+        sector_score = calculate_diversity_score(sector_alloc)
+        geography_score = calculate_diversity_score(geography_alloc)
+        max_holding_weight = float(weights.max())
     
+    return _build_score(
+        asset_class_alloc, sector_alloc, geography_alloc,
+        asset_class_score, sector_score, geography_score, max_holding_weight,
+    )
+
+
+def _build_score(
+    asset_class_alloc: Dict[Any, float],
+    sector_alloc: Dict[Any, float],
+    geography_alloc: Dict[Any, float],
+    asset_class_score: float,
+    sector_score: float,
+    geography_score: float,
+    max_holding_weight: float,
+) -> DiversificationScore:
+    """Rate concentration and pick recommendations from computed allocations and scores."""
     # Overall score (weighted average)
     overall_score = (asset_class_score * 0.4 + sector_score * 0.35 + geography_score * 0.25)
     
     # Concentration risk assessment
-    max_holding_weight = max(float(h.get("value", 0)) / total_value * 100 for h in holdings)
     max_sector_weight = max(sector_alloc.values()) if sector_alloc else 0
     
     if max_holding_weight > 50 or max_sector_weight > 60:
@@ -158,25 +210,18 @@ def analyze_diversification(holdings: List[Dict[str, Any]]) -> DiversificationSc
         concentration_risk = "LOW - Well diversified"
     
     # Generate recommendations
-    recommendations = []
-    
-    if len(asset_class_alloc) < 3:
-        recommendations.append("Consider adding more asset classes (bonds, real estate, commodities)")
-    
-    if asset_class_alloc.get("equity", 0) > 80:
-        recommendations.append("High equity allocation - consider adding bonds for stability")
-    
-    if asset_class_alloc.get("cash", 0) > 30:
-        recommendations.append("High cash position - consider deploying to growth assets")
-    
-    if geography_alloc.get("unknown", 0) > 50 or len(geography_alloc) < 2:
-        recommendations.append("Add international exposure for geographic diversification")
-    
-    if max_holding_weight > 20:
-        recommendations.append("Consider reducing largest positions to below 20% each")
-    
-    if sector_alloc.get("technology", 0) > 40:
-        recommendations.append("Heavy tech concentration - diversify into other sectors")
+    allocations = {
+        "asset_class": asset_class_alloc,
+        "sector": sector_alloc,
+        "geography": geography_alloc,
+        "holding": {"largest": max_holding_weight},
+    }
+    recommendations = [
+        message
+        for category, key, max_pct, min_count, message in _RECOMMENDATION_RULES
+        if len(allocations[category]) < min_count
+        or (key is not None and allocations[category].get(key, 0) > max_pct)
+    ]
     
     if not recommendations:
         recommendations.append("Portfolio is well diversified - maintain current allocation")
@@ -189,13 +234,99 @@ def analyze_diversification(holdings: List[Dict[str, Any]]) -> DiversificationSc
         concentration_risk=concentration_risk,
         recommendations=recommendations,
         breakdown={
-            "asset_class": dict(asset_class_alloc),
-            "sector": dict(sector_alloc),
-            "geography": dict(geography_alloc),
+            "asset_class": asset_class_alloc,
+            "sector": sector_alloc,
+            "geography": geography_alloc,
         }
     )
 
 
+def _batch_group_sum(
+    portfolio_ids: "np.ndarray", keys: List[Any], weights: "np.ndarray", n_portfolios: int
+) -> Tuple[List[Dict[Any, float]], List[float]]:
+    """
+    _group_sum and calculate_diversity_score for every portfolio of a flattened batch.
+    
+    Keys are coded per (portfolio, key), so one bincount sums all portfolios
+    and each allocation keeps its own first-seen order.
+    """
+    import numpy as np
+    
+    codes: Dict[Tuple[int, Any], int] = {}
+    idx = np.fromiter(
+        (codes.setdefault(pk, len(codes)) for pk in zip(portfolio_ids.tolist(), keys)),
+        dtype=np.intp, count=len(keys),
+    )
+    sums = np.bincount(idx, weights=weights, minlength=len(codes))
+    owner = np.fromiter((pid for pid, _ in codes), dtype=np.intp, count=len(codes))
+    
+    allocations: List[Dict[Any, float]] = [{} for _ in range(n_portfolios)]
+    for (pid, key), total in zip(codes, sums.tolist()):
+        allocations[pid][key] = total
+    
+    # Normalized Shannon entropy per portfolio, as in calculate_diversity_score
+    p = sums / np.bincount(owner, weights=sums, minlength=n_portfolios)[owner]
+    plogp = np.zeros_like(p)
+    nonzero = p > 0
+    plogp[nonzero] = p[nonzero] * np.log(p[nonzero])
+    entropy = -np.bincount(owner, weights=plogp, minlength=n_portfolios)
+    counts = np.bincount(owner, minlength=n_portfolios)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores = np.where(counts > 1, np.minimum(100.0, 100.0 * entropy / np.log(counts)), 0.0)
+    return allocations, scores.tolist()
+
+
+def analyze_diversification_batch(portfolios: List[List[Dict[str, Any]]]) -> List[DiversificationScore]:
+    """
+    Run analyze_diversification over many portfolios at once.
+    
+    All holdings are flattened into one set of arrays, so allocations and
+    scores come from a few vectorized reductions instead of a Python pass
+    per portfolio (cohort analysis, backtests).
+    
+    Args:
+        portfolios: List of holdings lists, as accepted by analyze_diversification
+    
+    Returns:
+        One DiversificationScore per portfolio, in input order.
+    """
+    import numpy as np
+    
+    n = len(portfolios)
+    holdings = [h for portfolio in portfolios for h in portfolio]
+    portfolio_ids = np.repeat(np.arange(n), [len(portfolio) for portfolio in portfolios])
+    values = _holding_values(holdings)
+    totals = np.bincount(portfolio_ids, weights=values, minlength=n)
+    
+    # Empty and zero-value portfolios get their fixed results from the single path
+    live = (totals != 0)[portfolio_ids]
+    holdings = [h for h, keep in zip(holdings, live.tolist()) if keep]
+    portfolio_ids = portfolio_ids[live]
+    weights = values[live] / totals[portfolio_ids] * 100
+    
+    max_weights = np.full(n, -np.inf)
+    np.maximum.at(max_weights, portfolio_ids, weights)
+    
+    asset_class_allocs, asset_class_scores = _batch_group_sum(
+        portfolio_ids, [h.get("asset_class", "unknown") for h in holdings], weights, n
+    )
+    sector_allocs, sector_scores = _batch_group_sum(
+        portfolio_ids, [h.get("sector", "unknown") for h in holdings], weights, n
+    )
+    geography_allocs, geography_scores = _batch_group_sum(
+        portfolio_ids, [h.get("geography", "unknown") for h in holdings], weights, n
+    )
+    
+    return [
+        _build_score(
+            asset_class_allocs[i], sector_allocs[i], geography_allocs[i],
+            asset_class_scores[i], sector_scores[i], geography_scores[i], max_weights[i].item(),
+        )
+        if totals[i] != 0 else analyze_diversification(portfolios[i])
+        for i in range(n)
+    ]
+
+
 def suggest_rebalancing(
     current_holdings: List[Dict[str, Any]],
     target_allocation: Optional[Dict[str, float]] = None
@@ -220,15 +351,15 @@ def suggest_rebalancing(
             "commodity": 0.05,
         }
     
-    total_value = sum(float(h.get("value", 0)) for h in current_holdings)
+    values = _holding_values(current_holdings)
+    total_value = float(values.sum())
     if total_value == 0:
         return []
     
-    # Current allocation
-    current_alloc = defaultdict(float)
-    for h in current_holdings:
-        asset_class = h.get("asset_class", "unknown")
-        current_alloc[asset_class] += float(h.get("value", 0)) / total_value
+    # Current allocation (fraction of total value per asset class)
+    current_alloc = _group_sum(
+        [h.get("asset_class", "unknown") for h in current_holdings], values / total_value
+    )
     
     trades = []
     
@@ -268,7 +399,7 @@ def analyze_diversification_tool(portfolio_json: str) -> str:
     Input should be a JSON string of holdings with symbol, value, asset_class, sector, geography.
     """
     try:
-        holdings = json.loads(portfolio_json)
+        holdings = loads(portfolio_json)
         if not isinstance(holdings, list):
             holdings = [holdings]
         score = analyze_diversification(holdings)
@@ -283,7 +414,7 @@ def suggest_rebalancing_tool(portfolio_json: str) -> str:
     Input should be a JSON string of holdings.
     """
     try:
-        holdings = json.loads(portfolio_json)
+        holdings = loads(portfolio_json)
         if not isinstance(holdings, list):
             holdings = [holdings]
         trades = suggest_rebalancing(holdings)
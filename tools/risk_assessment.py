@@ -1,9 +1,16 @@
 """Portfolio risk evaluation tools."""
+import bisect
+import functools
+import math
 from dataclasses import dataclass
-from typing import List, Optional, Dict, Any
-import numpy as np
+from typing import TYPE_CHECKING, List, Optional, Dict, Any, Tuple
 from enum import Enum
 
+from utils.fast_json import loads
+
+if TYPE_CHECKING:
+    import numpy as np
+
 
 class RiskLevel(str, Enum):
     """Risk tolerance levels."""
@@ -13,7 +20,7 @@ class RiskLevel(str, Enum):
     VERY_AGGRESSIVE = "very_aggressive"
 
 
-@dataclass
+@dataclass(slots=True)
 class Asset:
     """Represents an investment asset."""
     symbol: str
@@ -26,7 +33,7 @@ class Asset:
     volatility: Optional[float] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class RiskMetrics:
     """Portfolio risk metrics."""
     total_value: float
@@ -69,7 +76,7 @@ class RiskMetrics:
 """
 
 
-@dataclass
+@dataclass(slots=True)
 class RiskProfile:
     """User's risk profile based on questionnaire."""
     risk_level: RiskLevel
@@ -93,6 +100,80 @@ class RiskProfile:
         }
 
 
+# Daily VaR per unit of value and annual volatility: the one-sided normal
+# quantile (norm.ppf(0.95), norm.ppf(0.99)) scaled down by sqrt(252 trading days)
+_VAR_95_FACTOR = 1.6448536269514722 / math.sqrt(252)
+_VAR_99_FACTOR = 2.3263478740408408 / math.sqrt(252)
+
+# Rough drawdown estimate as a multiple of annual volatility, capped at 60%
+_DRAWDOWN_MULTIPLIER = 2.5
+_MAX_DRAWDOWN_CAP = 0.6
+
+# Assumed market volatility for beta
+_MARKET_VOLATILITY = 0.15
+
+# Default volatility by asset class if not provided
+DEFAULT_VOLATILITY = {
+    "equity": 0.20,
+    "bond": 0.05,
+    "cash": 0.01,
+    "real_estate": 0.12,
+    "commodity": 0.25,
+    "crypto": 0.80,
+}
+
+DEFAULT_RETURNS = {
+    "equity": 0.10,
+    "bond": 0.04,
+    "cash": 0.02,
+    "real_estate": 0.08,
+    "commodity": 0.05,
+    "crypto": 0.15,
+}
+
+# Correlation between holdings of two asset classes, used for portfolio
+# volatility. Unlisted classes count as "other". Within a class the value
+# applies to distinct holdings; a holding is fully correlated with itself.
+_CORRELATED_CLASSES = ("equity", "bond", "cash", "real_estate", "commodity", "crypto", "other")
+_CLASS_INDEX = {name: i for i, name in enumerate(_CORRELATED_CLASSES)}
+_OTHER_CLASS = _CLASS_INDEX["other"]
+_CLASS_CORRELATION = {
+    ("equity", "equity"): 0.7,
+    ("equity", "bond"): -0.1,
+    ("equity", "real_estate"): 0.4,
+    ("equity", "commodity"): 0.3,
+    ("equity", "crypto"): 0.4,
+    ("equity", "other"): 0.3,
+    ("bond", "bond"): 0.6,
+    ("bond", "cash"): 0.1,
+    ("bond", "real_estate"): 0.2,
+    ("bond", "other"): 0.1,
+    ("cash", "cash"): 0.3,
+    ("real_estate", "real_estate"): 0.7,
+    ("real_estate", "commodity"): 0.2,
+    ("real_estate", "crypto"): 0.1,
+    ("real_estate", "other"): 0.2,
+    ("commodity", "commodity"): 0.5,
+    ("commodity", "crypto"): 0.1,
+    ("commodity", "other"): 0.2,
+    ("crypto", "crypto"): 0.8,
+    ("crypto", "other"): 0.2,
+    ("other", "other"): 0.5,
+}
+
+
+@functools.cache
+def _class_correlation_matrix() -> "np.ndarray":
+    """Expand the pair table into a symmetric class-by-class matrix (unlisted pairs are 0)."""
+    import numpy as np
+    
+    matrix = np.zeros((len(_CORRELATED_CLASSES), len(_CORRELATED_CLASSES)))
+    for (a, b), rho in _CLASS_CORRELATION.items():
+        i, j = _CLASS_INDEX[a], _CLASS_INDEX[b]
+        matrix[i, j] = matrix[j, i] = rho
+    return matrix
+
+
 def calculate_portfolio_risk(holdings: List[Dict[str, Any]], risk_free_rate: float = 0.04) -> RiskMetrics:
     """
     Calculate comprehensive risk metrics for a portfolio.
@@ -106,79 +187,57 @@ def calculate_portfolio_risk(holdings: List[Dict[str, Any]], risk_free_rate: flo
     Returns:
         RiskMetrics with VaR, Sharpe ratio, volatility, etc.
     """
-    # Convert to Asset objects
-    assets = []
-    for h in holdings:
-        assets.append(Asset(
-            symbol=h.get("symbol", "UNKNOWN"),
-            name=h.get("name", "Unknown Asset"),
-            value=float(h.get("value", 0)),
-            asset_class=h.get("asset_class", "equity"),
-            sector=h.get("sector"),
-            geography=h.get("geography"),
-            annual_return=h.get("annual_return"),
-            volatility=h.get("volatility"),
-        ))
-    
-    if not assets:
+    if not holdings:
         return RiskMetrics(
             total_value=0, var_95=0, var_99=0,
             sharpe_ratio=0, volatility=0, max_drawdown=0
         )
     
-    total_value = sum(a.value for a in assets)
-    weights = np.array([a.value / total_value for a in assets])
+    # Imported on first use so registering the tools stays cheap
+    import numpy as np
     
-    # Default volatility by asset class if not provided
-    default_volatility = {
-        "equity": 0.20,
-        "bond": 0.05,
-        "cash": 0.01,
-        "real_estate": 0.12,
-        "commodity": 0.25,
-        "crypto": 0.80,
-    }
+    # One pass fills parallel arrays; everything after is vectorized
+    n = len(holdings)
+    values = np.empty(n)
+    volatilities = np.empty(n)
+    returns = np.empty(n)
+    classes = np.empty(n, dtype=np.intp)
+    for i, h in enumerate(holdings):
+        asset_class = h.get("asset_class", "equity")
+        classes[i] = _CLASS_INDEX.get(asset_class, _OTHER_CLASS)
+        values[i] = float(h.get("value", 0))
+        volatilities[i] = h.get("volatility") or DEFAULT_VOLATILITY.get(asset_class, 0.15)
+        returns[i] = h.get("annual_return") or DEFAULT_RETURNS.get(asset_class, 0.08)
     
-    default_returns = {
-        "equity": 0.10,
-        "bond": 0.04,
-        "cash": 0.02,
-        "real_estate": 0.08,
-        "commodity": 0.05,
-        "crypto": 0.15,
-    }
-    
-    volatilities = np.array([
-        a.volatility if a.volatility else default_volatility.get(a.asset_class, 0.15)
-        for a in assets
-    ])
-    
-    returns = np.array([
-        a.annual_return if a.annual_return else default_returns.get(a.asset_class, 0.08)
-        for a in assets
-    ])
-    
-    # Portfolio statistics
-    portfolio_return = np.sum(weights * returns)
-    # Simplified portfolio volatility (assuming low correlation)
-    portfolio_volatility = np.sqrt(np.sum((weights * volatilities) ** 2))
+    total_value = float(values.sum())
+    if total_value == 0:
+        return RiskMetrics(
+            total_value=0, var_95=0, var_99=0,
+            sharpe_ratio=0, volatility=0, max_drawdown=0
+        )
+    weights = values / total_value
     
-    # Daily volatility for VaR
-    daily_volatility = portfolio_volatility / np.sqrt(252)
+    # Portfolio statistics: dot products avoid the temporaries of sum(a * b);
+    # the scalar math below stays in plain floats
+    portfolio_return = float(weights @ returns)
+    # Portfolio volatility sqrt(w' Σ w), with Σ = (σσ') * correlation
+    weighted_vols = weights * volatilities
+    correlation = _class_correlation_matrix()[np.ix_(classes, classes)]
+    np.fill_diagonal(correlation, 1.0)
+    portfolio_volatility = math.sqrt(max(weighted_vols @ correlation @ weighted_vols, 0.0))
     
-    # Value at Risk calculations
-    var_95 = total_value * daily_volatility * 1.645
-    var_99 = total_value * daily_volatility * 2.326
+    # Value at Risk (daily)
+    var_95 = total_value * portfolio_volatility * _VAR_95_FACTOR
+    var_99 = total_value * portfolio_volatility * _VAR_99_FACTOR
     
     # Sharpe Ratio
     sharpe_ratio = (portfolio_return - risk_free_rate) / portfolio_volatility if portfolio_volatility > 0 else 0
     
     # Estimated max drawdown (simplified)
-    max_drawdown = portfolio_volatility * 2.5
+    max_drawdown = portfolio_volatility * _DRAWDOWN_MULTIPLIER
     
-    # Beta (assuming market volatility of 15%)
-    market_volatility = 0.15
-    beta = portfolio_volatility / market_volatility
+    # Beta (relative to the assumed market volatility)
+    beta = portfolio_volatility / _MARKET_VOLATILITY
     
     return RiskMetrics(
         total_value=total_value,
@@ -186,11 +245,36 @@ def calculate_portfolio_risk(holdings: List[Dict[str, Any]], risk_free_rate: flo
         var_99=var_99,
         sharpe_ratio=sharpe_ratio,
         volatility=portfolio_volatility,
-        max_drawdown=min(max_drawdown, 0.6),  # Cap at 60%
+        max_drawdown=min(max_drawdown, _MAX_DRAWDOWN_CAP),
         beta=beta,
     )
 
 
+# Questionnaire scoring tables, one delta per bucket. A value moves up a
+# bucket on reaching a cut in *_CUTS_AT, but only on exceeding one in
+# *_CUTS_PAST: age < 30, < 40, > 55, > 65 and horizon < 5, > 10, > 20 years.
+_AGE_CUTS_AT = (30, 40)
+_AGE_CUTS_PAST = (55, 65)
+_AGE_DELTAS = (20, 10, 0, -15, -25)
+_HORIZON_CUTS_AT = (5,)
+_HORIZON_CUTS_PAST = (10, 20)
+_HORIZON_DELTAS = (-20, 0, 5, 15)
+
+# Score bands: (risk level, equity allocation, bond allocation)
+_RISK_BAND_CUTS = (25, 50, 75)
+_RISK_BANDS = (
+    (RiskLevel.CONSERVATIVE, 0.25, 0.55),
+    (RiskLevel.MODERATE, 0.50, 0.35),
+    (RiskLevel.AGGRESSIVE, 0.70, 0.20),
+    (RiskLevel.VERY_AGGRESSIVE, 0.85, 0.10),
+)
+
+
+def _bucket(value: float, cuts_at: Tuple[float, ...], cuts_past: Tuple[float, ...]) -> int:
+    """Index of value's scoring bucket; every cut in cuts_at is below those in cuts_past."""
+    return bisect.bisect_right(cuts_at, value) + bisect.bisect_left(cuts_past, value)
+
+
 def assess_risk_tolerance(questionnaire: Dict[str, Any]) -> RiskProfile:
     """
     Evaluate user's risk tolerance based on questionnaire responses.
@@ -211,23 +295,11 @@ def assess_risk_tolerance(questionnaire: Dict[str, Any]) -> RiskProfile:
     
     # Age factor (younger = higher risk tolerance)
     age = questionnaire.get("age", 40)
-    if age < 30:
-        score += 20
-    elif age < 40:
-        score += 10
-    elif age > 55:
-        score -= 15
-    elif age > 65:
-        score -= 25
+    score += _AGE_DELTAS[_bucket(age, _AGE_CUTS_AT, _AGE_CUTS_PAST)]
     
     # Time horizon
     years = questionnaire.get("time_horizon", 10)
-    if years > 20:
-        score += 15
-    elif years > 10:
-        score += 5
-    elif years < 5:
-        score -= 20
+    score += _HORIZON_DELTAS[_bucket(years, _HORIZON_CUTS_AT, _HORIZON_CUTS_PAST)]
     
     # Experience
     experience = questionnaire.get("investment_experience", "beginner")
@@ -248,22 +320,7 @@ def assess_risk_tolerance(questionnaire: Dict[str, Any]) -> RiskProfile:
     score = max(0, min(100, score))
     
     # Determine risk level and allocations
-    if score < 25:
-        risk_level = RiskLevel.CONSERVATIVE
-        equity = 0.25
-        bonds = 0.55
-    elif score < 50:
-        risk_level = RiskLevel.MODERATE
-        equity = 0.50
-        bonds = 0.35
-    elif score < 75:
-        risk_level = RiskLevel.AGGRESSIVE
-        equity = 0.70
-        bonds = 0.20
-    else:
-        risk_level = RiskLevel.VERY_AGGRESSIVE
-        equity = 0.85
-        bonds = 0.10
+    risk_level, equity, bonds = _RISK_BANDS[bisect.bisect_right(_RISK_BAND_CUTS, score)]
     
     return RiskProfile(
         risk_level=risk_level,
@@ -281,9 +338,8 @@ def calculate_portfolio_risk_tool(portfolio_json: str) -> str:
     Calculate risk metrics for a portfolio. 
     Input should be a JSON string of holdings.
     """
-    import json
     try:
-        holdings = json.loads(portfolio_json)
+        holdings = loads(portfolio_json)
         if not isinstance(holdings, list):
             holdings = [holdings]
         metrics = calculate_portfolio_risk(holdings)
@@ -297,9 +353,8 @@ def assess_risk_tolerance_tool(questionnaire_json: str) -> str:
     Assess user's risk tolerance based on questionnaire.
     Input should be a JSON string with age, income, experience, time_horizon, loss_reaction, goal.
     """
-    import json
     try:
-        questionnaire = json.loads(questionnaire_json)
+        questionnaire = loads(questionnaire_json)
         profile = assess_risk_tolerance(questionnaire)
         return f"""
 🎯 **Risk Profile Assessment**
@@ -1,8 +1,12 @@
 """Investment strategy recommendation engine."""
 from dataclasses import dataclass, field
-from typing import List, Dict, Any, Optional
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Sequence, Tuple
 from enum import Enum
-import json
+
+from utils.fast_json import loads
+
+if TYPE_CHECKING:
+    import numpy as np
 
 
 class GoalType(str, Enum):
@@ -15,7 +19,11 @@ class GoalType(str, Enum):
     EMERGENCY_FUND = "emergency_fund"
 
 
-@dataclass
+# Goal types by value; plain dict lookup instead of GoalType(value)
+_GOAL_TYPES = {goal_type.value: goal_type for goal_type in GoalType}
+
+
+@dataclass(slots=True)
 class Goal:
     """Investment goal definition."""
     goal_type: GoalType
@@ -23,9 +31,18 @@ class Goal:
     years_to_goal: int
     current_savings: float = 0
     monthly_contribution: float = 0
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "goal_type": self.goal_type.value,
+            "target_amount": self.target_amount,
+            "years_to_goal": self.years_to_goal,
+            "current_savings": self.current_savings,
+            "monthly_contribution": self.monthly_contribution,
+        }
 
 
-@dataclass
+@dataclass(slots=True)
 class InvestmentPlan:
     """Personalized investment strategy."""
     strategy_name: str
@@ -127,6 +144,22 @@ STRATEGY_TEMPLATES = {
     },
 }
 
+
+def _short_horizon_allocation(allocation: Dict[str, float]) -> Dict[str, float]:
+    """Shift a template allocation toward bonds and cash for goals under 5 years away."""
+    adjusted = allocation.copy()
+    adjusted["equity"] = max(0.20, adjusted.get("equity", 0) - 0.20)
+    adjusted["bond"] = adjusted.get("bond", 0) + 0.15
+    adjusted["cash"] = adjusted.get("cash", 0) + 0.05
+    return adjusted
+
+
+# Short horizon: more conservative variant of each template, built once
+SHORT_HORIZON_ALLOCATIONS = {
+    name: _short_horizon_allocation(template["allocation"])
+    for name, template in STRATEGY_TEMPLATES.items()
+}
+
 # Investment suggestions by asset class
 INVESTMENT_SUGGESTIONS = {
     "equity": [
@@ -158,6 +191,28 @@ INVESTMENT_SUGGESTIONS = {
     ],
 }
 
+# Top suggestion per asset class, used in generated plans
+TOP_SUGGESTIONS = {
+    asset_class: investments[0]
+    for asset_class, investments in INVESTMENT_SUGGESTIONS.items()
+    if investments
+}
+
+
+def _template_key(risk_profile: str) -> str:
+    """STRATEGY_TEMPLATES key for a risk profile name; unknown profiles get "moderate"."""
+    key = risk_profile.lower().replace(" ", "_")
+    return key if key in STRATEGY_TEMPLATES else "moderate"
+
+
+def _monthly_savings_needed(target: float, savings: float, months: int, r: float) -> float:
+    """PMT: monthly deposit that, with savings compounding at monthly rate r, reaches target."""
+    if months <= 0 or r <= 0:
+        return target / 240  # No usable horizon: spread over a default 20 years
+    growth = (1 + r) ** months
+    remaining = max(0, target - max(savings, 0) * growth)
+    return remaining * r / (growth - 1)
+
 
 def design_strategy(
     risk_profile: str,
@@ -178,10 +233,7 @@ def design_strategy(
         InvestmentPlan with recommended allocation and action items.
     """
     # Get strategy template
-    risk_profile = risk_profile.lower().replace(" ", "_")
-    if risk_profile not in STRATEGY_TEMPLATES:
-        risk_profile = "moderate"
-    
+    risk_profile = _template_key(risk_profile)
     template = STRATEGY_TEMPLATES[risk_profile]
     
     # Parse goals
@@ -191,7 +243,7 @@ def design_strategy(
     
     for g in goals:
         goal = Goal(
-            goal_type=GoalType(g.get("goal_type", "wealth_building")),
+            goal_type=_GOAL_TYPES.get(g.get("goal_type"), GoalType.WEALTH_BUILDING),
             target_amount=float(g.get("target_amount", 100000)),
             years_to_goal=int(g.get("years", 10)),
             current_savings=float(g.get("current_savings", 0)),
@@ -211,79 +263,71 @@ def design_strategy(
         total_target = 500000
         min_years = 20
     
-    # Adjust allocation based on time horizon
-    allocation = template["allocation"].copy()
+    # Adjust allocation based on time horizon (shared dicts, copied into the plan)
     if min_years < 5:
-        # Short horizon: more conservative
-        allocation["equity"] = max(0.20, allocation.get("equity", 0) - 0.20)
-        allocation["bond"] = allocation.get("bond", 0) + 0.15
-        allocation["cash"] = allocation.get("cash", 0) + 0.05
+        allocation = SHORT_HORIZON_ALLOCATIONS[risk_profile]
+    else:
+        allocation = template["allocation"]
     
-    # Calculate required monthly savings
+    # Required monthly savings: PMT for each goal over its own horizon (capped
+    # at 30 years), summed. The current portfolio counts toward every goal in
+    # proportion to its target, on top of the goal's own savings.
     expected_return = template["expected_return"]
-    months = min_years * 12
+    r = expected_return / 12
+    n_goals = len(parsed_goals)
+    monthly_needed = sum(
+        _monthly_savings_needed(
+            goal.target_amount,
+            goal.current_savings + current_portfolio_value * (
+                goal.target_amount / total_target if total_target else 1 / n_goals
+            ),
+            min(goal.years_to_goal, 30) * 12,
+            r,
+        )
+        for goal in parsed_goals
+    )
     
-    if months > 0 and expected_return > 0:
-        # Future value calculation
-        r = expected_return / 12
-        if current_portfolio_value > 0:
-            future_current = current_portfolio_value * ((1 + r) ** months)
-        else:
-            future_current = 0
-        
-        remaining = max(0, total_target - future_current)
-        
-        if r > 0:
-            # PMT formula for required monthly savings
-            monthly_needed = remaining * r / (((1 + r) ** months) - 1)
-        else:
-            monthly_needed = remaining / months
-    else:
-        monthly_needed = total_target / 240  # Default 20 years
+    # Projection runs to the nearest goal
+    months = min_years * 12
+    growth = (1 + r) ** months
     
-    # Projected value with contributions
-    projected = current_portfolio_value
-    r = expected_return / 12
+    # Projected value with contributions (future value of an annuity)
     contribution = max(monthly_contribution, monthly_needed)
-    for _ in range(months):
-        projected = projected * (1 + r) + contribution
+    if months <= 0:
+        projected = current_portfolio_value
+    elif r > 0:
+        projected = current_portfolio_value * growth + contribution * (growth - 1) / r
+    else:
+        projected = current_portfolio_value + contribution * months
     
     # Generate portfolio suggestions
-    suggestions = []
-    for asset_class, pct in allocation.items():
-        if pct > 0 and asset_class in INVESTMENT_SUGGESTIONS:
-            for inv in INVESTMENT_SUGGESTIONS[asset_class][:1]:  # Top suggestion per class
-                suggestions.append({
-                    **inv,
-                    "allocation": pct,
-                    "amount": projected * pct,
-                })
-    
-    # Generate action items
-    action_items = []
-    
-    if current_portfolio_value == 0:
-        action_items.append("Open a brokerage account (Fidelity, Vanguard, or Schwab recommended)")
+    suggestions = [
+        {**TOP_SUGGESTIONS[asset_class], "allocation": pct, "amount": projected * pct}
+        for asset_class, pct in allocation.items()
+        if pct > 0 and asset_class in TOP_SUGGESTIONS
+    ]
     
-    action_items.append(f"Set up automatic monthly investment of ${contribution:,.0f}")
-    
-    if allocation.get("equity", 0) > 0.5:
-        action_items.append("Consider tax-advantaged accounts (401k, IRA) for equity holdings")
-    
-    action_items.append("Review and rebalance portfolio quarterly")
-    action_items.append("Increase contributions by 1-2% annually if possible")
-    
-    goal_types = [g.goal_type.value for g in parsed_goals]
-    if "retirement" in goal_types:
-        action_items.append("Maximize employer 401k match if available")
-    if "emergency_fund" in goal_types:
-        action_items.append("Keep 3-6 months expenses in high-yield savings")
+    # Generate action items, in display order
+    goal_types = {g.goal_type for g in parsed_goals}
+    action_items = [
+        text
+        for include, text in (
+            (current_portfolio_value == 0, "Open a brokerage account (Fidelity, Vanguard, or Schwab recommended)"),
+            (True, f"Set up automatic monthly investment of ${contribution:,.0f}"),
+            (allocation.get("equity", 0) > 0.5, "Consider tax-advantaged accounts (401k, IRA) for equity holdings"),
+            (True, "Review and rebalance portfolio quarterly"),
+            (True, "Increase contributions by 1-2% annually if possible"),
+            (GoalType.RETIREMENT in goal_types, "Maximize employer 401k match if available"),
+            (GoalType.EMERGENCY_FUND in goal_types, "Keep 3-6 months expenses in high-yield savings"),
+        )
+        if include
+    ]
     
     return InvestmentPlan(
         strategy_name=template["name"],
         risk_profile=risk_profile.replace("_", " ").title(),
         goals=parsed_goals,
-        recommended_allocation=allocation,
+        recommended_allocation=dict(allocation),
         monthly_savings_needed=monthly_needed,
         projected_value=projected,
         action_items=action_items,
@@ -291,6 +335,63 @@ def design_strategy(
     )
 
 
+def design_strategy_batch(
+    risk_profiles: Sequence[str],
+    target_amounts: Sequence[float],
+    years: Sequence[int],
+    current_portfolio_values: Optional[Sequence[float]] = None,
+    monthly_contributions: Optional[Sequence[float]] = None,
+) -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    Savings and projections for many single-goal scenarios at once.
+    
+    Same arithmetic as design_strategy for one goal without its own savings,
+    evaluated over arrays for what-if sweeps (one scenario per index).
+    
+    Args:
+        risk_profiles: Risk profile per scenario (as accepted by design_strategy)
+        target_amounts: Goal target per scenario
+        years: Years to goal per scenario
+        current_portfolio_values: Current investments value per scenario (default 0)
+        monthly_contributions: Planned monthly savings per scenario (default 0)
+    
+    Returns:
+        (monthly_savings_needed, projected_value) arrays.
+    """
+    import numpy as np
+    
+    n = len(risk_profiles)
+    expected_return = np.fromiter(
+        (STRATEGY_TEMPLATES[_template_key(p)]["expected_return"] for p in risk_profiles),
+        dtype=np.float64, count=n,
+    )
+    targets = np.asarray(target_amounts, dtype=np.float64)
+    current = np.zeros(n)
+    if current_portfolio_values is not None:
+        current = np.asarray(current_portfolio_values, dtype=np.float64)
+    planned = np.zeros(n)
+    if monthly_contributions is not None:
+        planned = np.asarray(monthly_contributions, dtype=np.float64)
+    
+    # design_strategy starts its horizon at 30 years and takes the shortest goal
+    months = np.minimum(np.asarray(years).astype(np.int64), 30) * 12
+    r = expected_return / 12
+    growth = (1 + r) ** months
+    compounding = (months > 0) & (r > 0)
+    
+    with np.errstate(divide="ignore", invalid="ignore"):
+        remaining = np.maximum(0, targets - np.where(current > 0, current * growth, 0))
+        monthly_needed = np.where(compounding, remaining * r / (growth - 1), targets / 240)
+        contribution = np.maximum(planned, monthly_needed)
+        annuity = np.where(
+            r > 0,
+            current * growth + contribution * (growth - 1) / r,
+            current + contribution * months,
+        )
+        projected = np.where(months <= 0, current, annuity)
+    return monthly_needed, projected
+
+
 # LangChain tool function
 def design_strategy_tool(strategy_request_json: str) -> str:
     """
@@ -302,7 +403,7 @@ def design_strategy_tool(strategy_request_json: str) -> str:
     - monthly_contribution (optional)
     """
     try:
-        request = json.loads(strategy_request_json)
+        request = loads(strategy_request_json)
         plan = design_strategy(
             risk_profile=request.get("risk_profile", "moderate"),
             goals=request.get("goals", []),
@@ -82,7 +82,7 @@ async function sendMessage() {
     showLoading(true);
 
     try {
-        const response = await fetch(`${API_BASE}/chat`, {
+        const response = await fetch(`${API_BASE}/chat/stream`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -93,12 +93,35 @@ async function sendMessage() {
             })
         });
 
-        const data = await response.json();
-
-        if (data.error) {
+        if (!response.ok) {
+            const data = await response.json();
             addMessage('assistant', `⚠️ Error: ${data.error}`);
+            return;
+        }
+
+        // Render the reply as it streams in
+        const container = document.getElementById('chat-container');
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let text = '';
+        let content = null;
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            text += decoder.decode(value, { stream: true });
+            if (content === null) {
+                showLoading(false);
+                content = addMessage('assistant', text);
+            } else {
+                content.innerHTML = formatContent(text);
+                container.scrollTop = container.scrollHeight;
+            }
+        }
+        text += decoder.decode();
+        if (content === null) {
+            addMessage('assistant', text);
         } else {
-            addMessage('assistant', data.response);
+            content.innerHTML = formatContent(text);
         }
     } catch (error) {
         addMessage('assistant', `⚠️ Could not connect to the server. Please make sure the Flask API is running.\n\nRun: \`python api/app.py\``);
@@ -125,6 +148,7 @@ function addMessage(role, content) {
 
     container.appendChild(messageDiv);
     container.scrollTop = container.scrollHeight;
+    return messageDiv.querySelector('.message-content');
 }
 
 function formatContent(content) {
@@ -0,0 +1 @@
+"""Shared helpers for Wealth Management AI Chatbot."""
@@ -0,0 +1,126 @@
+"""Process-wide ChromaDB clients."""
+import os
+import re
+import hashlib
+import functools
+import threading
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+from config.settings import settings
+
+_clients: Dict[str, Any] = {}
+_clients_lock = threading.Lock()
+
+
+def get_chroma_client(persist_directory: str) -> Any:
+    """
+    Get the shared ChromaDB client for a persist directory, creating it once.
+
+    Every user's collections live in one client, so the on-disk store is
+    opened once per process instead of once per FinancialMemory. When
+    settings.chroma_http_url is set, a Chroma server is used instead of the
+    embedded store, so concurrent sessions no longer contend on one
+    in-process SQLite writer.
+
+    Raises:
+        ImportError: If chromadb is not installed
+    """
+    if settings.chroma_http_url:
+        return _get_http_client(settings.chroma_http_url)
+
+    path = os.path.abspath(persist_directory)
+    client = _clients.get(path)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(path)
+            if client is None:
+                import chromadb
+                from chromadb.config import Settings
+
+                os.makedirs(path, exist_ok=True)
+                client = chromadb.PersistentClient(
+                    path=path,
+                    settings=Settings(anonymized_telemetry=False)
+                )
+                _clients[path] = client
+    return client
+
+
+def _get_http_client(url: str) -> Any:
+    """Get the shared client for a Chroma server at url."""
+    client = _clients.get(url)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(url)
+            if client is None:
+                import chromadb
+
+                parts = urlsplit(url)
+                client = chromadb.HttpClient(
+                    host=parts.hostname or "localhost",
+                    port=parts.port or 8000,
+                    ssl=parts.scheme == "https",
+                )
+                _clients[url] = client
+    return client
+
+
+@functools.cache
+def get_embedding_function() -> Any:
+    """
+    Get the embedding function shared by every collection, loading it once.
+
+    Uses settings.chroma_embedding_model through sentence-transformers,
+    preferring its ONNX Runtime backend over float32 PyTorch on CPU. Without
+    sentence-transformers, ChromaDB's bundled ONNX MiniLM model is used.
+
+    Raises:
+        ImportError: If chromadb is not installed
+    """
+    from chromadb.utils import embedding_functions as ef
+
+    try:
+        import sentence_transformers  # noqa: F401
+    except ImportError:
+        return ef.DefaultEmbeddingFunction()
+
+    model_name = settings.chroma_embedding_model
+    try:
+        return ef.SentenceTransformerEmbeddingFunction(model_name=model_name, backend="onnx")
+    except Exception:
+        # Older sentence-transformers, or optimum/onnxruntime missing
+        return ef.SentenceTransformerEmbeddingFunction(model_name=model_name)
+
+
+# Names ChromaDB accepts: 3-63 of [A-Za-z0-9._-], starting and ending alphanumeric
+_VALID_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9_-]{1,61}[A-Za-z0-9]")
+
+
+def collection_name(kind: str, owner: Optional[str] = None) -> str:
+    """
+    Name of the kind collection (of owner, e.g. a user ID) under the shared embedding function.
+
+    Vectors from different models are not comparable, so collections embedded
+    by settings.chroma_embedding_model carry the model name as a suffix. The
+    unsuffixed name stays with ChromaDB's default MiniLM model, which earlier
+    versions used for every collection. An owner that would make the name
+    invalid (too long, or characters ChromaDB rejects) is replaced by its hash.
+
+    Raises:
+        ImportError: If chromadb is not installed
+    """
+    from chromadb.utils import embedding_functions as ef
+
+    suffix = ""
+    if not isinstance(get_embedding_function(), ef.DefaultEmbeddingFunction):
+        model = settings.chroma_embedding_model.rsplit("/", 1)[-1]
+        suffix = "_" + re.sub(r"[^A-Za-z0-9_-]+", "-", model)
+
+    if owner is None:
+        return kind + suffix
+    name = f"{kind}_{owner}{suffix}"
+    if not _VALID_NAME.fullmatch(name):
+        digest = hashlib.blake2b(owner.encode("utf-8"), digest_size=12).hexdigest()
+        name = f"{kind}_{digest}{suffix}"
+    return name
@@ -0,0 +1,36 @@
+"""JSON encode/decode backed by orjson when installed, stdlib json otherwise."""
+import json
+from typing import Any, Callable, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+if orjson is not None:
+    def dumps_bytes(
+        obj: Any, default: Optional[Callable[[Any], Any]] = None, sort_keys: bool = False
+    ) -> bytes:
+        """Serialize obj to compact UTF-8 JSON bytes (numpy scalars and arrays included)."""
+        option = orjson.OPT_SERIALIZE_NUMPY | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        return orjson.dumps(obj, default=default, option=option)
+
+    loads = orjson.loads
+else:
+    def dumps_bytes(
+        obj: Any, default: Optional[Callable[[Any], Any]] = None, sort_keys: bool = False
+    ) -> bytes:
+        """Serialize obj to compact UTF-8 JSON bytes."""
+        return json.dumps(obj, default=default, separators=(",", ":"), sort_keys=sort_keys).encode()
+
+    def loads(data: Any) -> Any:
+        """Parse JSON from str, bytes, bytearray or memoryview."""
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return json.loads(data)
+
+
+def dumps(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> str:
+    """Serialize obj to a compact JSON string."""
+    return dumps_bytes(obj, default).decode()